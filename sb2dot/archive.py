@@ -0,0 +1,147 @@
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: archive.py
+# task: writes all generated graphs into one zip or tar archive (--archive)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import gzip
+import json
+import tarfile
+import threading
+import zipfile
+
+try:
+  from cStringIO import StringIO
+except ImportError:
+  from io import BytesIO as StringIO
+
+try:
+  import Queue as queue
+except ImportError:
+  import queue
+
+# fixed member times like the gzip output of outputdot.py, so unchanged
+# graphs give byte identical archives. Zip can not go below 1980.
+TAR_MTIME = 0
+ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+
+class FixedTarInfo(tarfile.TarInfo):
+  """ writes the device numbers of every member as Python 2 does, Python 3
+      leaves them empty for anything but devices """
+  @staticmethod
+  def _create_header(info, *args):
+    buf = tarfile.TarInfo._create_header(info, *args)
+    buf = buf[:329] + b"0000000\0" * 2 + buf[345:]
+    chksum = tarfile.calc_chksums(buf)[0]
+    return buf[:148] + ("%06o\0" % chksum).encode('ascii') + buf[155:]
+
+def archive_format(path):
+  """ returns (format, compressed) derived from the archive file name """
+  if path.endswith('.zip'):
+    return 'zip', False
+  elif path.endswith('.tar.gz') or path.endswith('.tgz'):
+    return 'tar', True
+  elif path.endswith('.tar'):
+    return 'tar', False
+  return None, False
+
+class ArchiveWriter(object):
+  """ collects (name, data) members and writes them from a background
+      thread, so compression does not run on the decoding thread
+
+      Next to the archive an index (archive + '.index.json') lists every
+      member with its size and, where the format allows it, the offset of
+      its data so single graphs can be pulled out without scanning.
+  """
+  def __init__(self, path, fmt, compress):
+    self.path = path
+    self.fmt = fmt
+    self.compress = compress
+    self.index = []
+    self.error = None
+    self.queue = queue.Queue(64)
+    self.gzip = None
+
+    if fmt == 'zip':
+      mode = compress and zipfile.ZIP_DEFLATED or zipfile.ZIP_STORED
+      self.archive = zipfile.ZipFile(path, 'w', mode, True)
+    else:
+      # Python 3 defaults to pax headers, keep the GNU format of Python 2
+      if compress:
+        # 'w:gz' would stamp the current time into the gzip header
+        self.gzip = gzip.GzipFile(path, 'wb', mtime=TAR_MTIME)
+      self.archive = tarfile.open(path, 'w', fileobj=self.gzip,
+                                  format=tarfile.GNU_FORMAT)
+
+    self.thread = threading.Thread(target=self.run, name='archive-writer')
+    self.thread.daemon = True
+    self.thread.start()
+
+  def add(self, name, data):
+    if self.error is not None:
+      raise self.error
+    self.queue.put((name, data))
+
+  def write_member(self, name, data):
+    if self.fmt == 'zip':
+      info = zipfile.ZipInfo(name, ZIP_DATE)
+      info.compress_type = self.archive.compression
+      info.external_attr = 0o644 << 16
+      self.archive.writestr(info, data)
+      self.index.append({'name': name, 'size': len(data), 'offset': info.header_offset})
+    else:
+      info = FixedTarInfo(name)
+      info.size = len(data)
+      info.mtime = TAR_MTIME
+      info.mode = 0o644
+      self.archive.addfile(info, StringIO(data))
+      entry = {'name': name, 'size': len(data)}
+      if not self.compress:
+        # data ends at the current archive offset, padded to 512 bytes
+        entry['offset'] = self.archive.offset - (len(data) + 511) // 512 * 512
+      self.index.append(entry)
+
+  def run(self):
+    while True:
+      item = self.queue.get()
+      if item is None:
+        break
+      if self.error is not None:
+        continue
+      try:
+        self.write_member(*item)
+      except Exception as e:
+        self.error = e
+
+  def close(self):
+    self.queue.put(None)
+    self.thread.join()
+    self.archive.close()
+    if self.gzip is not None:
+      self.gzip.close()
+    if self.error is not None:
+      raise self.error
+
+    f = open(self.path + '.index.json', 'w')
+    json.dump({'archive': self.path, 'format': self.fmt,
+               'compressed': self.compress, 'members': self.index},
+              f, indent=1, sort_keys=True, separators=(', ', ': '))
+    f.write("\n")
+    f.close()
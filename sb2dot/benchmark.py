@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: benchmark.py
+# task: micro benchmarks on synthetic input
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+from __future__ import print_function
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import redis
+
+PATH_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789/._-"
+
+def synthetic_regex(rnd):
+  """ builds the bytecode of a random path-like regular expression """
+  code = bytearray()
+  if rnd.random() < 0.7:
+    code.append(0x19)
+  for part in range(rnd.randint(1, 12)):
+    kind = rnd.random()
+    if kind < 0.6:
+      for c in range(rnd.randint(1, 16)):
+        code += bytearray([0x02, ord(rnd.choice(PATH_CHARS))])
+    elif kind < 0.8:
+      cnt = rnd.randint(1, 4)
+      code.append(0x0b | (cnt << 4))
+      for r in range(cnt):
+        lo = rnd.randint(0x20, 0x7e)
+        code += bytearray([lo, rnd.randint(lo, 0x7e)])
+    else:
+      # .* as split/any/jump loop
+      idx = len(code)
+      code += bytearray([0x2f]) + struct.pack('<H', idx + 7)
+      code.append(0x09)
+      # jumps are 0x?a, the decoders ignore the high nibble
+      code += bytearray([0x0a | (rnd.randint(0, 15) << 4)]) + struct.pack('<H', idx)
+  if rnd.random() < 0.7:
+    code.append(0x29)
+  code += bytearray([0x15, 0])
+  return struct.pack('>I', 3) + struct.pack('<H', len(code)) + bytes(code)
+
+def synthetic_corpus(count, seed=1):
+  rnd = random.Random(seed)
+  return [synthetic_regex(rnd) for i in range(count)]
+
+def same_graph(g1, g2):
+  return g1.nodes == g2.nodes and g1.edges == g2.edges and \
+         g1.redges == g2.redges and g1.tags == g2.tags
+
+def timed(func, corpus):
+  start = time.time()
+  for raw in corpus:
+    func(raw)
+  return time.time() - start
+
+def bench_regex_decoder(count):
+  corpus = synthetic_corpus(count)
+  size = sum([len(raw) for raw in corpus])
+  print("[+] regex decoder: %u synthetic regular expressions, %u bytes" % (count, size))
+
+  for raw in corpus:
+    if not same_graph(redis.reToGraph(raw), redis.reToGraphStringIO(raw)):
+      print("[!] decoders disagree on %r" % raw)
+      return False
+
+  old = timed(redis.reToGraphStringIO, corpus)
+  new = timed(redis.reToGraph, corpus)
+  print("[i]    cStringIO decoder:  %.3fs" % old)
+  print("[i]    bytearray decoder:  %.3fs (%.2fx)" % (new, old / new))
+  return True
+
+def run_sb2dot(python, args):
+  """ runs sb2dot.py under python in a new directory, returns the run time
+      and the directory """
+  out = tempfile.mkdtemp(prefix='sb2dot-bench-')
+  script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sb2dot.py')
+  start = time.time()
+  p = subprocess.Popen([python, script] + args, cwd=out,
+                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+  log = p.communicate()[0]
+  elapsed = time.time() - start
+  if p.returncode != 0:
+    print("[!] %s failed:" % python)
+    print(log.decode('latin-1'))
+    shutil.rmtree(out)
+    return None, None
+  return elapsed, out
+
+def read_tree(top):
+  files = {}
+  for dirpath, dirnames, filenames in os.walk(top):
+    for name in filenames:
+      path = os.path.join(dirpath, name)
+      f = open(path, 'rb')
+      files[os.path.relpath(path, top)] = f.read()
+      f.close()
+  return files
+
+def bench_interpreters(pythons, args):
+  """ converts the same input under every interpreter, the generated files
+      have to be byte identical """
+  # the runs happen in temporary directories
+  args = [os.path.exists(arg) and os.path.abspath(arg) or arg for arg in args]
+  print("[+] interpreters: sb2dot.py %s" % " ".join(args))
+
+  base = None
+  ok = True
+  for python in pythons:
+    elapsed, out = run_sb2dot(python, args)
+    if out is None:
+      return False
+    files = read_tree(out)
+    shutil.rmtree(out)
+    if base is None:
+      base = (elapsed, files)
+    print("[i]    %-30s %.3fs (%.2fx), %u files" % (python, elapsed, base[0] / elapsed, len(files)))
+    for name in sorted(set(base[1]) | set(files)):
+      if base[1].get(name) != files.get(name):
+        print("[!]    %s differs from the output of %s" % (name, pythons[0]))
+        ok = False
+  return ok
+
+def main():
+  if len(sys.argv) > 3 and sys.argv[1] == '--interpreters':
+    if not bench_interpreters(sys.argv[2].split(','), sys.argv[3:]):
+      sys.exit(1)
+    return
+
+  count = 20000
+  if len(sys.argv) > 1:
+    count = int(sys.argv[1])
+  if not bench_regex_decoder(count):
+    sys.exit(1)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,76 @@
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: cache.py
+# task: memo and size bounded LRU cache with a common get/put interface
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+from collections import OrderedDict
+import stats
+
+class Pool(object):
+  """ unbounded memo with the same get/put interface as LRUCache """
+  __slots__ = ('entries', )
+
+  def __init__(self):
+    self.entries = {}
+
+  def get(self, key):
+    return self.entries.get(key)
+
+  def put(self, key, value):
+    self.entries[key] = value
+
+  def clear(self):
+    self.entries.clear()
+
+  def __len__(self):
+    return len(self.entries)
+
+class LRUCache(object):
+  def __init__(self, size, name='lru'):
+    self.size = size
+    self.name = name
+    self.entries = OrderedDict()
+
+  def get(self, key):
+    try:
+      value = self.entries.pop(key)
+    except KeyError:
+      if stats.enabled:
+        stats.count(self.name + '_misses')
+      return None
+    # re-insert to mark it as most recently used
+    self.entries[key] = value
+    if stats.enabled:
+      stats.count(self.name + '_hits')
+    return value
+
+  def put(self, key, value):
+    if key in self.entries:
+      del self.entries[key]
+    elif len(self.entries) >= self.size:
+      self.entries.popitem(last=False)
+    self.entries[key] = value
+
+  def clear(self):
+    self.entries.clear()
+
+  def __len__(self):
+    return len(self.entries)
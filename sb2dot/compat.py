@@ -0,0 +1,60 @@
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: compat.py
+# task: differences between Python 2 and Python 3
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Profiles contain byte strings. Everything read from a profile is turned
+# into text with text() right away and written back with binary(): on
+# Python 3 latin-1 maps every byte to the code point of the same value, so
+# the output files get exactly the bytes Python 2 writes.
+#
+
+import sys
+
+PY3 = sys.version_info[0] >= 3
+
+if PY3:
+  def text(data):
+    return data.decode('latin-1')
+
+  def binary(s):
+    return s.encode('latin-1')
+
+  def open_text(path, mode='r'):
+    return open(path, mode, encoding='latin-1', newline='')
+else:
+  def text(data):
+    return data
+
+  def binary(s):
+    return s
+
+  def open_text(path, mode='r'):
+    return open(path, mode)
+
+def json_text(s):
+  """ str for the JSON encoder, profile strings are not always UTF-8 """
+  try:
+    return binary(s).decode('utf-8', 'replace')
+  except (AttributeError, UnicodeError):
+    return s
+
+def json_filter_text(tag):
+  return json_text(str(tag).replace("\0", ""))
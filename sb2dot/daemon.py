@@ -0,0 +1,291 @@
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: daemon.py
+# task: keeps decoded profiles in memory and answers queries (--daemon)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# protocol: one JSON object per line in both directions, every request has
+# a "query" member:
+#
+#   {"query": "profiles"}
+#   {"query": "ops", "profile": NAME}
+#   {"query": "evaluate", "profile": NAME, "operation": OP, "match": [FILTER, ...],
+#    "path": PATH}
+#   {"query": "search", "pattern": TEXT or GLOB}
+#   {"query": "dump", "profile": NAME, "operation": OP, "format": "dot" or "sbpl"}
+#
+# FILTER is the text of a filter like it is shown in the graphs, e.g.
+# (literal "/etc/passwd"). evaluate treats the listed filters as matching
+# and all others as not matching. With the optional "path", literal and
+# regex filters are decided by comparing against PATH instead, with one
+# scan per operation (pathmatch.py). The mount-relative filters need the
+# mount point of PATH and are still taken from "match". If several files
+# contain a profile of the same name, requests naming it also need
+# "file": PATH. Failed requests get {"error": MESSAGE}.
+#
+
+from __future__ import print_function
+import fnmatch
+import json
+import os
+import signal
+import sys
+import threading
+from compat import json_text, json_filter_text
+import outputdot
+import pathmatch
+import sbpl
+import summary
+
+try:
+  import SocketServer as socketserver
+except ImportError:
+  import socketserver
+
+def path_test(matcher, path, match):
+  """ filter test for summary.evaluate(), see the evaluate query """
+  known = matcher.match(path.encode('utf-8'))
+  def test(tag):
+    result = known.get(tag)
+    if result is None:
+      return json_filter_text(tag) in match
+    return result
+  return test
+
+class QueryError(Exception):
+  pass
+
+class LoadedProfile(object):
+  def __init__(self, name, path, g, op_table):
+    self.name = name
+    self.path = path
+    self.g = g
+    self.op_table = op_table
+    self.summaries = summary.reachable_terminals(g, [offset * 8 for offset in set(op_table)])
+    self.path_matchers = {}
+
+  def path_matcher(self, root):
+    """ built on first use, concurrent requests may build it twice """
+    m = self.path_matchers.get(root)
+    if m is None:
+      m = self.path_matchers[root] = pathmatch.PathMatcher(self.g, root)
+    return m
+
+class ProfileStore(object):
+  """ decoded profiles of a set of files, a file is decoded again when its
+      modification time or size changes. If that fails the profiles of the
+      previous version stay.
+
+      load(path) returns [(profile name, graph, op table)] and is never
+      called concurrently, decoding uses module level state. Readers use
+      the profiles dict without locking, it is replaced and never changed.
+  """
+  def __init__(self, paths, load, op_names):
+    self.paths = paths
+    self.load = load
+    self.op_names = op_names
+    self.lock = threading.Lock()
+    self.stamps = {}
+    self.profiles = {}
+    self.search_index = None
+    for path in paths:
+      self.reload(path)
+
+  def stamp(self, path):
+    st = os.stat(path)
+    return (st.st_mtime, st.st_size)
+
+  def reload(self, path):
+    with self.lock:
+      stamp = self.stamp(path)
+      if self.stamps.get(path) == stamp:
+        return
+      print('[+] loading ' + path)
+      try:
+        loaded = [LoadedProfile(name, path, g, op_table)
+                  for name, g, op_table in self.load(path)]
+      except Exception as e:
+        # e.g. truncated while it is being rewritten, the last good version
+        # is served until the file changes again
+        print('[!] cannot decode %s, keeping its previous profiles: %s: %s' % \
+              (path, type(e).__name__, e))
+        self.stamps[path] = stamp
+        return
+      profiles = dict([(key, p) for key, p in self.profiles.items() if p.path != path])
+      for p in loaded:
+        profiles[(p.path, p.name)] = p
+      self.profiles = profiles
+      self.search_index = None
+      self.stamps[path] = stamp
+
+  def refresh(self):
+    for path in self.paths:
+      try:
+        if self.stamp(path) != self.stamps.get(path):
+          self.reload(path)
+      except (OSError, IOError) as e:
+        print('[!] cannot reload %s: %s' % (path, e))
+
+  def profile(self, req):
+    name = req.get('profile')
+    path = req.get('file')
+    found = [p for (p_path, p_name), p in self.profiles.items()
+             if p_name == name and path in (None, p_path)]
+    if len(found) == 0:
+      raise QueryError('unknown profile: %s' % name)
+    if len(found) > 1:
+      raise QueryError('profile %s is in several files, add "file"' % name)
+    return found[0]
+
+  def root(self, p, operation):
+    if operation == 'default':
+      return p.op_table[0] * 8
+    if operation not in self.op_names:
+      raise QueryError('unknown operation: %s' % operation)
+    return p.op_table[self.op_names.index(operation)] * 8
+
+  def index(self):
+    """ filter text -> {profile name: set of operations} """
+    index = self.search_index
+    if index is not None:
+      return index
+    with self.lock:
+      if self.search_index is not None:
+        return self.search_index
+      index = {}
+      for p in self.profiles.values():
+        by_root = {}
+        for op_idx, offset in enumerate(p.op_table):
+          by_root.setdefault(offset * 8, []).append(self.op_names[op_idx])
+        for root, ops in by_root.items():
+          for u in outputdot.collect_nodes(p.g, root):
+            if p.g.edges[u]:
+              entry = index.setdefault(json_filter_text(p.g.getTag(u)), {})
+              entry.setdefault((p.path, p.name), set()).update(ops)
+      self.search_index = index
+      return index
+
+  # queries
+
+  def q_profiles(self, req):
+    return {'profiles': [{'name': json_text(p.name), 'file': p.path}
+                         for key, p in sorted(self.profiles.items())]}
+
+  def q_ops(self, req):
+    p = self.profile(req)
+    ops = []
+    for op_idx, op in enumerate(self.op_names):
+      terms = p.summaries[p.op_table[op_idx] * 8]
+      ops.append({'operation': op, 'result': summary.verdict(terms),
+                  'modifiers': summary.modifiers(terms),
+                  'unconditional': summary.is_unconditional(terms)})
+    return {'operations': ops}
+
+  def q_evaluate(self, req):
+    p = self.profile(req)
+    root = self.root(p, req.get('operation'))
+    match = set(req.get('match', []))
+    path = req.get('path')
+    if path is not None:
+      if not isinstance(path, type(u'')):
+        raise QueryError('path must be a string')
+      test = path_test(p.path_matcher(root), path, match)
+    else:
+      test = lambda tag: json_filter_text(tag) in match
+    t = summary.evaluate(p.g, root, test, p.summaries)
+    return {'result': t.allow and 'allow' or 'deny', 'modifiers': t.modifiers,
+            'terminal': repr(t)}
+
+  def q_search(self, req):
+    pattern = req.get('pattern')
+    if not pattern:
+      raise QueryError('missing pattern')
+    glob = any([c in pattern for c in '*?['])
+    results = []
+    index = self.index()
+    for f in sorted(index):
+      if (glob and fnmatch.fnmatchcase(f, pattern)) or (not glob and pattern in f):
+        for (path, name), ops in sorted(index[f].items()):
+          results.append({'filter': f, 'file': path, 'profile': json_text(name),
+                          'operations': sorted(ops)})
+    return {'results': results}
+
+  def q_dump(self, req):
+    p = self.profile(req)
+    operation = req.get('operation')
+    root = self.root(p, operation)
+    fmt = req.get('format', 'dot')
+    if fmt == 'dot':
+      header, out, count = outputdot.render_dot(p.g, root // 8, operation, p.name)
+      return {'text': json_text(header + out + "} \n")}
+    elif fmt == 'sbpl':
+      return {'text': json_text(sbpl.decompile(p.name, p.g, p.summaries, [(root, [operation])]))}
+    raise QueryError('unknown format: %s' % fmt)
+
+  def query(self, req):
+    if not isinstance(req, dict):
+      raise QueryError('request must be a JSON object')
+    handler = getattr(self, 'q_' + str(req.get('query')), None)
+    if handler is None:
+      raise QueryError('unknown query: %s' % req.get('query'))
+    self.refresh()
+    return handler(req)
+
+class QueryHandler(socketserver.StreamRequestHandler):
+  def handle(self):
+    store = self.server.store
+    while True:
+      line = self.rfile.readline()
+      if not line:
+        break
+      line = line.strip()
+      if not line:
+        continue
+      try:
+        req = json.loads(line)
+      except ValueError as e:
+        resp = {'error': 'invalid JSON: %s' % e}
+      else:
+        try:
+          resp = store.query(req)
+        except QueryError as e:
+          resp = {'error': str(e)}
+        except Exception as e:
+          # a bad argument fails the request, not the connection
+          resp = {'error': '%s: %s' % (type(e).__name__, e)}
+      self.wfile.write((json.dumps(resp, sort_keys=True) + "\n").encode('ascii'))
+      self.wfile.flush()
+
+class QueryServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  daemon_threads = True
+
+def serve(socket_path, store):
+  if os.path.exists(socket_path):
+    os.remove(socket_path)
+  server = QueryServer(socket_path, QueryHandler)
+  server.store = store
+  print('[+] listening on ' + socket_path)
+  signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    os.remove(socket_path)
@@ -0,0 +1,253 @@
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: graphstats.py
+# task: structural statistics of decision graphs (--format stats-csv/stats-json)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import json
+from compat import json_text
+from filters import *
+
+CSV_COLUMNS = ['profile', 'operation', 'nodes', 'max_depth', 'shared_nodes',
+               'shared_ratio', 'distinct_regexes', 'terminals',
+               'filter_types', 'fanin']
+
+def walk(g, roots):
+  """ post-order of all nodes reachable from roots and the parents of every
+      node among them, one depth first walk. Children are visited in
+      sorted order, so the order does not depend on the interpreter. """
+  order = []
+  seen = set()
+  parents = {}
+  for root in roots:
+    if root in seen:
+      continue
+    seen.add(root)
+    parents.setdefault(root, [])
+    stack = [(root, iter(sorted(g.edges.get(root, ()))))]
+    while stack:
+      u, it = stack[-1]
+      for v in it:
+        parents.setdefault(v, []).append(u)
+        if v not in seen:
+          seen.add(v)
+          stack.append((v, iter(sorted(g.edges.get(v, ())))))
+          break
+      else:
+        stack.pop()
+        order.append(u)
+  return order, parents
+
+def reachable_sets(g, order, parents, roots):
+  """ the nodes reachable from every root as an int bit set over the
+      indices in order, built bottom up. The set of a node is dropped as
+      soon as all its parents are done. """
+  bit = dict([(u, i) for i, u in enumerate(order)])
+  roots = set(roots)
+  pending = dict([(u, len(parents[u])) for u in order])
+  sets = {}
+  result = {}
+  for u in order:
+    s = 1 << bit[u]
+    for v in g.edges.get(u, ()):
+      s |= sets[v]
+      pending[v] -= 1
+      if pending[v] == 0 and v not in roots:
+        del sets[v]
+    sets[u] = s
+    if u in roots:
+      result[u] = s
+  return bit, result
+
+def popcount(s):
+  return bin(s).count('1')
+
+def masks_by(keys):
+  """ bit set of the nodes for every key, keys is a list in node order """
+  masks = {}
+  for i, key in enumerate(keys):
+    if key is not None:
+      masks[key] = masks.get(key, 0) | (1 << i)
+  return masks
+
+def histogram(masks, s):
+  h = {}
+  for key in masks:
+    n = popcount(masks[key] & s)
+    if n:
+      h[key] = n
+  return h
+
+def regex_key(tag):
+  # the bytecode where it is known, the stats formats do not decompile
+  if tag.bytecode is not None:
+    return tag.bytecode
+  return tag.s
+
+def profile_stats(g, profile_name, op_groups):
+  """ op_groups is a list of (operation names, node offset) tuples.
+
+      The graph is walked once for all operations. Every node gets a bit,
+      the numbers of an operation come from the bit set of the nodes it
+      reaches: counts are popcounts of that set and per node masks.
+  """
+  roots = [offset * 8 for name, offset in op_groups]
+  order, parents = walk(g, roots)
+
+  depth = {}
+  terminal_keys = []
+  type_keys = []
+  regex_keys = []
+  for u in order:
+    d = 0
+    for v in g.edges.get(u, ()):
+      if depth[v] + 1 > d:
+        d = depth[v] + 1
+    depth[u] = d
+
+    tag = g.getTag(u)
+    if isinstance(tag, Terminal):
+      terminal_keys.append(repr(tag))
+      type_keys.append(None)
+      regex_keys.append(None)
+    else:
+      terminal_keys.append(None)
+      type_keys.append(type(tag).__name__)
+      if isinstance(tag, REGEX_FILTERS):
+        regex_keys.append(regex_key(tag))
+      else:
+        regex_keys.append(None)
+  terminal_masks = masks_by(terminal_keys)
+  type_masks = masks_by(type_keys)
+  regex_masks = masks_by(regex_keys)
+
+  bit, sets = reachable_sets(g, order, parents, roots)
+  # only nodes with several parents overall can have more than one inside a
+  # reachable set, their parents are looked up in the set's bit string
+  multi_mask = 0
+  parent_bits = {}
+  for u in order:
+    if len(parents[u]) > 1:
+      multi_mask |= 1 << bit[u]
+      parent_bits[bit[u]] = [bit[p] for p in parents[u]]
+
+  def stats_for(s, roots):
+    count = popcount(s)
+    shared = 0
+    fanin_hist = {}
+    members = bin(s)[:1:-1]
+    candidates = bin(s & multi_mask)[:1:-1]
+    multi = 0
+    i = candidates.find('1')
+    while i >= 0:
+      multi += 1
+      n = 0
+      for p in parent_bits[i]:
+        if members[p:p+1] == '1':
+          n += 1
+      fanin_hist[n] = fanin_hist.get(n, 0) + 1
+      if n > 1:
+        shared += 1
+      i = candidates.find('1', i + 1)
+    # of the other nodes the roots have no parent inside the set and the
+    # rest exactly one
+    top = len([root for root in roots if bit[root] not in parent_bits])
+    if top:
+      fanin_hist[0] = fanin_hist.get(0, 0) + top
+    if count - multi - top:
+      fanin_hist[1] = fanin_hist.get(1, 0) + count - multi - top
+    return {
+      'nodes': count,
+      'max_depth': max([depth[root] for root in roots] + [0]),
+      'shared_nodes': shared,
+      'shared_ratio': count and float(shared) / count or 0.0,
+      'distinct_regexes': len(histogram(regex_masks, s)),
+      'terminals': histogram(terminal_masks, s),
+      'filter_types': histogram(type_masks, s),
+      'fanin': fanin_hist,
+    }
+
+  ops = []
+  for name, offset in op_groups:
+    st = stats_for(sets[offset * 8], [offset * 8])
+    st['operation'] = name
+    ops.append(st)
+  union = 0
+  for root in sets:
+    union |= sets[root]
+  summary = stats_for(union, [u for u in order if not parents[u]])
+  return {'profile': profile_name, 'summary': summary, 'operations': ops}
+
+def format_hist(h):
+  return ";".join(["%s=%u" % (k, h[k]) for k in sorted(h)])
+
+def csv_quote(s):
+  s = str(s)
+  if "," in s or "\"" in s or "\n" in s:
+    s = "\"" + s.replace("\"", "\"\"") + "\""
+  return s
+
+def csv_row(profile, operation, s):
+  row = []
+  for c in CSV_COLUMNS:
+    if c == 'profile':
+      v = profile
+    elif c == 'operation':
+      v = operation
+    elif c == 'shared_ratio':
+      v = "%.4f" % s[c]
+    elif c in ('terminals', 'filter_types', 'fanin'):
+      v = format_hist(s[c])
+    else:
+      v = s[c]
+    row.append(csv_quote(v))
+  return ",".join(row) + "\n"
+
+class StatsWriter(object):
+  """ writes one record per profile as soon as it has been decoded """
+  def __init__(self, f, fmt):
+    self.f = f
+    self.fmt = fmt
+    self.first = True
+    if fmt == 'csv':
+      f.write(",".join(CSV_COLUMNS) + "\n")
+    else:
+      f.write("[\n")
+
+  def add(self, ps):
+    if self.fmt == 'csv':
+      self.f.write(csv_row(ps['profile'], '*', ps['summary']))
+      for s in ps['operations']:
+        self.f.write(csv_row(ps['profile'], s['operation'].replace("\n", " "), s))
+    else:
+      if not self.first:
+        self.f.write(",\n")
+      # profile names are not always UTF-8
+      record = dict(ps)
+      record['profile'] = json_text(ps['profile'])
+      record['operations'] = [dict(s, operation=json_text(s['operation']))
+                              for s in ps['operations']]
+      json.dump(record, self.f, sort_keys=True)
+    self.first = False
+
+  def close(self):
+    if self.fmt != 'csv':
+      self.f.write("\n]\n")
+    self.f.flush()
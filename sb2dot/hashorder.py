@@ -0,0 +1,274 @@
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: hashorder.py
+# task: sets and dicts of ints that iterate in Python 2 order
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# The reductions in redis.graphToRegEx() pick the first node that matches
+# a pattern, so which regex comes out depends on the iteration order of the
+# graph's sets and dicts. Python 3 iterates them in a different order, IntSet
+# and IntDict replay the open addressing of Python 2.7's setobject.c and
+# dictobject.c (which share it) to give the same results on both.
+#
+
+from bisect import bisect_left, insort
+
+MINSIZE = 8
+PERTURB_SHIFT = 5
+SIZE_T = (1 << 64) - 1
+
+# marks a deleted slot, lookups probe past it and inserts may reuse it
+DUMMY = object()
+
+class Table(object):
+  """ where the keys would sit in a Python 2.7 hash table """
+  __slots__ = ('slots', 'mask', 'fill', 'used', 'order', 'version', 'cached')
+
+  def __init__(self):
+    self.slots = [None] * MINSIZE
+    self.mask = MINSIZE - 1
+    self.fill = 0
+    self.used = 0
+    # sorted indices of the used slots, rebuilt after a resize
+    self.order = []
+    # counts changes to the slots, iterators notice changes by it
+    self.version = 0
+    # (version, keys) of the last key_list()
+    self.cached = None
+
+  def lookup(self, key):
+    """ slot of key, or the slot an insert of key would take """
+    slots = self.slots
+    mask = self.mask
+    perturb = hash(key) & SIZE_T
+    i = perturb & mask
+    k = slots[i]
+    if k is None or k == key and k is not DUMMY:
+      return i
+    freeslot = None
+    if k is DUMMY:
+      freeslot = i
+    while True:
+      i = (i * 5 + perturb + 1) & SIZE_T
+      j = i & mask
+      k = slots[j]
+      if k is None:
+        if freeslot is not None:
+          return freeslot
+        return j
+      if k is DUMMY:
+        if freeslot is None:
+          freeslot = j
+      elif k == key:
+        return j
+      perturb >>= PERTURB_SHIFT
+
+  def insert(self, key):
+    slots = self.slots
+    i = hash(key) & self.mask
+    k = slots[i]
+    if k is not None:
+      if k == key:
+        return
+      i = self.lookup(key)
+      k = slots[i]
+    if k is None:
+      self.fill += 1
+    elif k is not DUMMY:
+      return
+    slots[i] = key
+    self.used += 1
+    self.version += 1
+    if self.order is not None:
+      insort(self.order, i)
+
+  def insert_clean(self, key):
+    """ insert into a table without dummies that does not contain key """
+    slots = self.slots
+    mask = self.mask
+    perturb = hash(key) & SIZE_T
+    i = perturb & mask
+    while slots[i & mask] is not None:
+      i = (i * 5 + perturb + 1) & SIZE_T
+      perturb >>= PERTURB_SHIFT
+    slots[i & mask] = key
+    self.fill += 1
+    self.used += 1
+
+  def add(self, key):
+    used = self.used
+    self.insert(key)
+    if self.used > used and self.fill * 3 >= (self.mask + 1) * 2:
+      self.resize(self.used * (self.used > 50000 and 2 or 4))
+
+  def delete(self, key):
+    i = self.lookup(key)
+    if self.slots[i] is None or self.slots[i] is DUMMY:
+      raise KeyError(key)
+    self.slots[i] = DUMMY
+    self.used -= 1
+    self.version += 1
+    if self.order is not None:
+      del self.order[bisect_left(self.order, i)]
+
+  def resize(self, minused):
+    size = MINSIZE
+    while size <= minused:
+      size <<= 1
+    if size == MINSIZE and self.mask + 1 == MINSIZE and self.fill == self.used:
+      # the small table without dummies stays as it is
+      return
+    old = self.slots
+    self.order = None
+    self.version += 1
+    self.slots = [None] * size
+    self.mask = size - 1
+    self.fill = 0
+    self.used = 0
+    for k in old:
+      if k is not None and k is not DUMMY:
+        self.insert_clean(k)
+
+  def merge(self, other):
+    """ set_merge(), the |= of two sets """
+    if other is self or other.used == 0:
+      return
+    if (self.fill + other.used) * 3 >= (self.mask + 1) * 2:
+      self.resize((self.used + other.used) * 2)
+    for k in other.slots:
+      if k is not None and k is not DUMMY:
+        self.insert(k)
+
+  def used_slots(self):
+    order = self.order
+    if order is None:
+      slots = self.slots
+      order = self.order = [i for i in range(self.mask + 1)
+                            if slots[i] is not None and slots[i] is not DUMMY]
+    return order
+
+  def key_list(self):
+    """ the keys in iteration order, callers must not change the list """
+    cached = self.cached
+    if cached is not None and cached[0] == self.version:
+      return cached[1]
+    slots = self.slots
+    keys = [slots[i] for i in self.used_slots()]
+    self.cached = (self.version, keys)
+    return keys
+
+  def keys(self):
+    """ walks the table like the Python 2 iterators, which tolerate
+        changes that leave the size unchanged """
+    order = self.used_slots()
+    slots = self.slots
+    used = self.used
+    version = self.version
+    pos = 0
+    for i in order:
+      if self.version != version:
+        break
+      yield slots[i]
+      pos = i + 1
+    if self.version == version:
+      return
+    # changed while iterating, continue on the live table
+    while True:
+      if self.used != used:
+        raise RuntimeError('changed size during iteration')
+      slots = self.slots
+      while pos <= self.mask and (slots[pos] is None or slots[pos] is DUMMY):
+        pos += 1
+      if pos > self.mask:
+        return
+      yield slots[pos]
+      pos += 1
+
+class IntSet(set):
+  """ set that iterates in Python 2 order, supports the operations the
+      graphs use: add, remove, discard and |= """
+  __slots__ = ('table',)
+
+  def __init__(self, items=()):
+    set.__init__(self)
+    self.table = Table()
+    for k in items:
+      self.add(k)
+
+  def add(self, key):
+    set.add(self, key)
+    self.table.add(key)
+
+  def remove(self, key):
+    set.remove(self, key)
+    self.table.delete(key)
+
+  def discard(self, key):
+    if key in self:
+      self.remove(key)
+
+  def __ior__(self, other):
+    set.__ior__(self, other)
+    if isinstance(other, IntSet):
+      self.table.merge(other.table)
+    else:
+      for k in other:
+        self.table.add(k)
+    return self
+
+  def __iter__(self):
+    return self.table.keys()
+
+class IntDict(dict):
+  """ dict that iterates in Python 2 order, supports item assignment and
+      del but not update() or setdefault(). Iterating walks a snapshot of
+      the keys, the graphs never add or delete keys while doing that. """
+  __slots__ = ('table', 'cached')
+
+  def __init__(self):
+    dict.__init__(self)
+    self.table = Table()
+    # items() until the next assignment or del
+    self.cached = None
+
+  def __setitem__(self, key, value):
+    dict.__setitem__(self, key, value)
+    self.table.add(key)
+    self.cached = None
+
+  def __delitem__(self, key):
+    dict.__delitem__(self, key)
+    self.table.delete(key)
+    self.cached = None
+
+  def __iter__(self):
+    return iter(self.table.key_list())
+
+  def keys(self):
+    return list(self.table.key_list())
+
+  def values(self):
+    get = dict.__getitem__
+    return [get(self, k) for k in self.table.key_list()]
+
+  def items(self):
+    if self.cached is None:
+      get = dict.__getitem__
+      self.cached = [(k, get(self, k)) for k in self.table.key_list()]
+    return list(self.cached)
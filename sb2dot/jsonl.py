@@ -0,0 +1,121 @@
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: jsonl.py
+# task: streams decoded profiles as JSON lines (--format jsonl)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# one JSON object per line, "type" is one of:
+#
+#   regex      file, index, offset, size (of the bytecode), regex (null if
+#              it failed to decompile)
+#   profile    file, profile
+#   operation  file, profile, operation, index, node (offset of its root)
+#   node       file, profile, offset and either
+#                terminal true, result, modifiers
+#              or
+#                terminal false, filter (as in .sb files), filter_type,
+#                filter_id, filter_arg, argument, match, unmatch
+#
+# offsets are byte offsets into the profile file like the node names of the
+# .dot files, every node is written once per profile. Regexes are written
+# when they are decompiled, with --stream, --profile or --op that is only
+# done for the ones the written nodes use.
+#
+
+import json
+import stats
+from compat import json_text, json_filter_text
+from filters import StringFilter
+
+def slot_names(cls):
+  names = []
+  for c in reversed(cls.__mro__):
+    names.extend(getattr(c, '__slots__', ()))
+  return names
+
+def filter_argument(tag):
+  """ the string of string and regex filters, the decoded attributes of
+      the others (a single value or an object) """
+  if isinstance(tag, StringFilter):
+    if tag.s is None:
+      return None
+    return json_text(tag.s.rstrip('\0'))
+  values = {}
+  for name in slot_names(type(tag)):
+    value = getattr(tag, name, None)
+    if isinstance(value, str):
+      value = json_text(value)
+    values[name] = value
+  if len(values) == 1:
+    return list(values.values())[0]
+  return values
+
+class JsonlWriter(object):
+  """ writes every record as soon as it is known and flushes after every
+      operation, so consumers can start before the run is done. source is
+      the profile file the next records come from. """
+  def __init__(self, f):
+    self.f = f
+    self.source = ''
+
+  def write(self, record):
+    record['file'] = json_text(self.source)
+    self.f.write(json.dumps(record, sort_keys=True) + "\n")
+    if stats.enabled:
+      stats.count('jsonl_records')
+
+  def regex(self, idx, offset, re, raw):
+    if re is not None:
+      re = json_text(re)
+    self.write({'type': 'regex', 'index': idx, 'offset': offset * 8,
+                'size': len(raw), 'regex': re})
+    self.f.flush()
+
+  def profile(self, profile_name):
+    self.write({'type': 'profile', 'profile': json_text(profile_name)})
+    self.f.flush()
+
+  def operation(self, profile_name, op_name, op_idx, op_offset):
+    self.write({'type': 'operation', 'profile': json_text(profile_name),
+                'operation': op_name, 'index': op_idx, 'node': op_offset * 8})
+
+  def node(self, profile_name, offset, node):
+    """ node is a tuple returned by read_filternode """
+    tag, match, unmatch, filter, filter_arg = node
+    record = {'type': 'node', 'profile': json_text(profile_name), 'offset': offset * 8}
+    if match is None:
+      record['terminal'] = True
+      record['result'] = tag.allow and 'allow' or 'deny'
+      record['modifiers'] = tag.modifiers
+    else:
+      record['terminal'] = False
+      record['filter'] = json_filter_text(tag)
+      record['filter_type'] = type(tag).__name__
+      record['filter_id'] = filter
+      record['filter_arg'] = filter_arg
+      record['argument'] = filter_argument(tag)
+      record['match'] = match * 8
+      record['unmatch'] = unmatch * 8
+    self.write(record)
+
+  def flush(self):
+    self.f.flush()
+
+  def close(self):
+    self.f.flush()
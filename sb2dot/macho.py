@@ -0,0 +1,374 @@
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: macho.py
+# task: finds built-in profiles and operation names in Mach-O binaries
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# The profile name table and profile table are located the same way as in
+# extract_sbprofiles.c, but the file is mmapped and every profile is handed
+# to the decoder as a view into the mapping instead of a file. Operation
+# names are found like extract_sbops.c does and cached by file hash.
+#
+
+import hashlib
+import mmap
+import os
+import struct
+import compat
+
+MH_MAGIC = 0xfeedface
+MH_MAGIC_64 = 0xfeedfacf
+FAT_MAGIC = 0xcafebabe
+
+LC_SEGMENT = 0x1
+LC_SEGMENT_64 = 0x19
+
+# same sanity limit as extract_sbprofiles.c
+MAX_SIZE = 100 * 1024 * 1024
+
+class MachOError(Exception):
+  pass
+
+def data_view(data, offset, size):
+  """ zero-copy view of size bytes of data starting at offset """
+  try:
+    return buffer(data, offset, size)
+  except NameError:
+    return memoryview(data)[offset:offset + size]
+
+def is_macho(path):
+  f = open(path, 'rb')
+  head = f.read(4)
+  f.close()
+  if len(head) < 4:
+    return False
+  magic, = struct.unpack('<I', head)
+  return magic in (MH_MAGIC, MH_MAGIC_64) or struct.unpack('>I', head)[0] == FAT_MAGIC
+
+class MemoryFile(object):
+  """ minimal read-only file object on top of a view, enough for sb2dot """
+  def __init__(self, data):
+    self.data = data
+    self.pos = 0
+
+  def seek(self, offset, whence=0):
+    if whence == 1:
+      offset += self.pos
+    elif whence == 2:
+      offset += len(self.data)
+    self.pos = offset
+
+  def tell(self):
+    return self.pos
+
+  def read(self, size=-1):
+    start = self.pos
+    if size < 0:
+      end = len(self.data)
+    else:
+      end = min(start + size, len(self.data))
+    self.pos = max(start, end)
+    return bytes(self.data[start:end])
+
+  def close(self):
+    pass
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+class MachO(object):
+  def __init__(self, data, base=0):
+    self.data = data
+    self.base = base
+    self.segments = []
+    self.sections = {}
+
+    magic, = struct.unpack_from('<I', data, base)
+    if magic == MH_MAGIC_64:
+      self.ptr = struct.Struct('<Q')
+      ncmds, sizeofcmds = struct.unpack_from('<II', data, base + 16)
+      pos = base + 32
+    elif magic == MH_MAGIC:
+      self.ptr = struct.Struct('<I')
+      ncmds, sizeofcmds = struct.unpack_from('<II', data, base + 16)
+      pos = base + 28
+    else:
+      raise MachOError('not a Mach-O file')
+
+    end = pos + sizeofcmds
+    for i in range(ncmds):
+      if pos + 8 > end:
+        raise MachOError('load commands out of bounds')
+      cmd, cmdsize = struct.unpack_from('<II', data, pos)
+      if cmd == LC_SEGMENT_64:
+        self.load_segment(pos, '<16sQQQQIIII', '<16s16sQQI', 80)
+      elif cmd == LC_SEGMENT:
+        self.load_segment(pos, '<16sIIIIIIII', '<16s16sIII', 68)
+      if cmdsize < 8:
+        raise MachOError('illegal load command')
+      pos += cmdsize
+
+    if not self.segments:
+      raise MachOError('no segments')
+
+  def require_sections(self, *names):
+    for name in names:
+      if name not in self.sections:
+        raise MachOError('unexpected layout, missing %s.%s' % name)
+
+  def load_segment(self, pos, seg_fmt, sect_fmt, sect_size):
+    seg = struct.Struct(seg_fmt)
+    cmdsize, = struct.unpack_from('<I', self.data, pos + 4)
+    segname, vmaddr, vmsize, fileoff, filesize, maxprot, initprot, nsects, flags = \
+      seg.unpack_from(self.data, pos + 8)
+    if segname.rstrip(b'\0') == b'__PAGEZERO':
+      return
+    if nsects > 1000 or seg.size + 8 + nsects * sect_size > cmdsize:
+      raise MachOError('illegal section count')
+    self.segments.append((vmaddr, vmsize, fileoff, min(filesize, vmsize)))
+
+    pos += 8 + seg.size
+    for i in range(nsects):
+      sectname, segname, addr, size, offset = struct.unpack_from(sect_fmt, self.data, pos)
+      self.sections[(compat.text(segname.rstrip(b'\0')), compat.text(sectname.rstrip(b'\0')))] = (addr, size, offset)
+      pos += sect_size
+
+  def file_offset(self, vmaddr, size=0):
+    """ offset of vmaddr in the file, or None if the size bytes there are
+        not backed by the file """
+    if size > MAX_SIZE:
+      return None
+    for seg_vmaddr, vmsize, fileoff, filesize in self.segments:
+      if seg_vmaddr <= vmaddr and vmaddr + size <= seg_vmaddr + filesize:
+        offset = self.base + fileoff + vmaddr - seg_vmaddr
+        if offset + size <= len(self.data):
+          return offset
+    return None
+
+  def vm_address(self, offset):
+    """ inverse of file_offset(), None for data outside all segments """
+    offset -= self.base
+    for seg_vmaddr, vmsize, fileoff, filesize in self.segments:
+      if fileoff <= offset < fileoff + filesize:
+        return seg_vmaddr + offset - fileoff
+    return None
+
+  def pointer(self, offset):
+    return self.ptr.unpack_from(self.data, offset)[0]
+
+  def in_section(self, vmaddr, name):
+    addr, size, offset = self.sections[name]
+    return addr <= vmaddr <= addr + size
+
+  def pointers(self, name):
+    addr, size, offset = self.sections[name]
+    count = size // self.ptr.size
+    start = self.file_offset(addr, count * self.ptr.size)
+    if start is None:
+      return []
+    fmt = '<%u%s' % (count, self.ptr.format[-1])
+    return list(struct.unpack_from(fmt, self.data, start))
+
+  def cstring(self, vmaddr):
+    start = self.file_offset(vmaddr)
+    end = self.data.find(b'\0', start)
+    if end < 0:
+      end = len(self.data)
+    return compat.text(self.data[start:end])
+
+  def profile_data(self, vmaddr):
+    """ (data address, size) of a profile table entry or None """
+    entry = self.file_offset(vmaddr, 2 * self.ptr.size)
+    if entry is None:
+      return None
+    data, size = struct.unpack_from('<2' + self.ptr.format[-1], self.data, entry)
+    if self.file_offset(data, size) is None:
+      return None
+    return data, size
+
+def first_run(flags, predicate):
+  """ start of the first run of True flags for which predicate(length) holds,
+      checking every start position like the scans of extract_sbprofiles.c """
+  i = 0
+  while i < len(flags):
+    if not flags[i]:
+      i += 1
+      continue
+    start = i
+    while i < len(flags) and flags[i]:
+      i += 1
+    # a scan starting inside the run sees a shorter run
+    for s in range(start, i):
+      if predicate(i - s):
+        return s, i - s
+  return None, 0
+
+def find_profile_nametable(m, ptrs):
+  flags = [m.in_section(p, ('__TEXT', '__cstring')) for p in ptrs]
+  return first_run(flags, lambda n: n > 3)
+
+def find_profile_table(m, ptrs, count):
+  flags = [m.in_section(p, ('__DATA', '__data')) and m.profile_data(p) is not None
+           for p in ptrs]
+  start, length = first_run(flags, lambda n: n == count)
+  return start
+
+def map_file(path):
+  f = open(path, 'rb')
+  data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  f.close()
+  return data
+
+def open_slices(data):
+  """ Mach-O headers of a thin or fat binary """
+  magic, = struct.unpack_from('>I', data, 0)
+  if magic != FAT_MAGIC:
+    return [MachO(data)]
+  nfat, = struct.unpack_from('>I', data, 4)
+  slices = []
+  for i in range(nfat):
+    cputype, subtype, offset, size, align = struct.unpack_from('>IIIII', data, 8 + 20 * i)
+    try:
+      slices.append(MachO(data, offset))
+    except (MachOError, struct.error):
+      pass
+  return slices
+
+def builtin_profiles(path):
+  """ returns [(name, view)] for all built-in profiles of a Mach-O binary.
+      The views point into a read-only mapping of the file. For fat
+      binaries the first slice containing profiles is used. """
+  data = map_file(path)
+  error = MachOError('no Mach-O slices')
+  for m in open_slices(data):
+    try:
+      m.require_sections(('__DATA', '__data'), ('__DATA', '__const'), ('__TEXT', '__cstring'))
+      ptrs = m.pointers(('__DATA', '__const'))
+      start, count = find_profile_nametable(m, ptrs)
+      if start is None:
+        raise MachOError('cannot find built-in sandbox profile names')
+      table = find_profile_table(m, ptrs, count)
+      if table is None:
+        raise MachOError('cannot find built-in sandbox profile table')
+    except (MachOError, struct.error) as e:
+      error = e
+      continue
+
+    profiles = []
+    for i in range(count):
+      name = m.cstring(ptrs[start + i])
+      vmaddr, size = m.profile_data(ptrs[table + i])
+      profiles.append((name, data_view(data, m.file_offset(vmaddr, size), size)))
+    return profiles
+  raise error
+
+# kmod_info name of the sandbox driver, followed by the start of the version
+KMOD_NAME = b'com.apple.security.sandbox' + b'\0' * 38
+
+def find_sandbox_driver(m):
+  """ file offset of the Mach-O header of the sandbox driver, which is the
+      file itself for Sandbox.kext and a prelinked kext in a kernelcache """
+  data = m.data
+  pos = data.find(KMOD_NAME, m.base)
+  while pos >= 0 and not data[pos+64:pos+65].isdigit():
+    pos = data.find(KMOD_NAME, pos + 1)
+  if pos < 0:
+    return None
+
+  # scan back page by page for the header
+  vmaddr = m.vm_address(pos)
+  if vmaddr is None:
+    return None
+  vmaddr &= ~0xfff
+  while vmaddr >= 0:
+    offset = m.file_offset(vmaddr, 4)
+    if offset is not None:
+      magic, = struct.unpack_from('<I', data, offset)
+      if magic in (MH_MAGIC, MH_MAGIC_64):
+        return offset
+    elif vmaddr < min([seg[0] for seg in m.segments]):
+      break
+    vmaddr -= 0x1000
+  return None
+
+def find_opnames_table(m, driver):
+  """ file offset of the pointer table whose first entry is "default" """
+  data = m.data
+  pos = data.find(b'default\0', driver)
+  if pos < 0:
+    return None
+  vmaddr = m.vm_address(pos)
+  if vmaddr is None:
+    return None
+  pos = data.find(m.ptr.pack(vmaddr), driver)
+  if pos < 0:
+    return None
+  return pos
+
+def read_opnames_table(m, table):
+  """ the table ends with a NULL pointer or when "default" shows up again """
+  names = []
+  first = m.pointer(table)
+  ptr = first
+  while True:
+    names.append(m.cstring(ptr))
+    table += m.ptr.size
+    ptr = m.pointer(table)
+    if ptr == 0 or ptr == first or m.file_offset(ptr) is None:
+      break
+  return names
+
+def operation_names(path):
+  """ operation names from the Sandbox kext or a decrypted kernelcache """
+  data = map_file(path)
+  for m in open_slices(data):
+    driver = find_sandbox_driver(m)
+    if driver is None:
+      continue
+    table = find_opnames_table(m, driver)
+    if table is None:
+      raise MachOError('cannot find operation_names in Sandbox driver')
+    return read_opnames_table(m, table)
+  raise MachOError('cannot find Sandbox driver in file')
+
+def cached_operation_names(path, cache_dir):
+  """ operation_names() cached in cache_dir as sbops.txt style files named
+      after the sha1 of the binary """
+  f = open(path, 'rb')
+  digest = hashlib.sha1(f.read()).hexdigest()
+  f.close()
+
+  cache_path = os.path.join(cache_dir, digest + '.sbops')
+  if os.path.exists(cache_path):
+    f = compat.open_text(cache_path)
+    names = [s.strip() for s in f.readlines()]
+    f.close()
+    return names, True
+
+  names = operation_names(path)
+  if not os.path.isdir(cache_dir):
+    os.makedirs(cache_dir)
+  f = compat.open_text(cache_path + '.tmp', 'w')
+  f.write("\n".join(names) + "\n")
+  f.close()
+  os.rename(cache_path + '.tmp', cache_path)
+  return names, False
@@ -0,0 +1,167 @@
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: manifest.py
+# task: content hashes of decision graphs for incremental re-runs (--manifest)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+from __future__ import print_function
+import hashlib
+import json
+import os
+import struct
+import compat
+import filters
+
+MANIFEST_VERSION = 2
+
+def file_hash(fn):
+  f = open(fn, 'rb')
+  h = hashlib.sha1(f.read()).hexdigest()
+  f.close()
+  return h
+
+class SubgraphHasher(object):
+  """ hashes the raw bytes of a decision subgraph without decoding it
+
+      Node offsets are replaced by the hashes of the nodes they point to and
+      string, network and regex arguments by the bytes they reference, so
+      the hash does not change when unrelated parts of the file move.
+  """
+  def __init__(self, f, re_offsets, memo=None):
+    """ memo can hold the node digests of a snapshot (snapshot.py) """
+    self.f = f
+    self.re_offsets = re_offsets
+    self.memo = memo or {}
+
+  def read_blob(self, offset, extra=0):
+    self.f.seek(offset * 8)
+    count, = struct.unpack('<I', self.f.read(4))
+    return self.f.read(count + extra)
+
+  def arg_bytes(self, filter, filter_arg):
+    entry = filters.filter_table.get(filter)
+    decode_arg = entry and entry[1]
+    if decode_arg in (filters.arg_string, filters.arg_string_nopadding):
+      return self.read_blob(filter_arg, 1)
+    elif decode_arg is filters.arg_regex:
+      return self.read_blob(self.re_offsets[filters.regex_alias.get(filter_arg, filter_arg)])
+    elif decode_arg is filters.arg_network:
+      self.f.seek(filter_arg * 8)
+      return self.f.read(8)
+    return struct.pack('<H', filter_arg)
+
+  def node(self, offset):
+    digest = self.memo.get(offset)
+    if digest is not None:
+      return digest
+
+    self.f.seek(offset * 8)
+    raw = self.f.read(8)
+    if ord(raw[0:1]) == 1:
+      digest = hashlib.sha1(b'T' + raw[2:4]).digest()
+    else:
+      filter, filter_arg, match, unmatch = struct.unpack('<BHHH', raw[1:8])
+      h = hashlib.sha1(b'F' + struct.pack('B', filter))
+      h.update(self.arg_bytes(filter, filter_arg))
+      h.update(self.node(match))
+      h.update(self.node(unmatch))
+      digest = h.digest()
+    self.memo[offset] = digest
+    return digest
+
+  def hexdigest(self, offset, salt):
+    return hashlib.sha1(compat.binary(salt) + self.node(offset)).hexdigest()
+
+class Manifest(object):
+  """ maps output files to the hash of the graph they were generated from
+
+      key covers everything that is not part of the graph itself but still
+      changes the output (sbops file, filter table, output options), a
+      manifest with a different key is ignored completely.
+
+      The outputs are kept per input file, so several profile files can
+      share a manifest. A run only updates and cleans up the outputs of
+      its own input.
+  """
+  def __init__(self, path, key, input):
+    self.path = path
+    self.key = "%u:%s" % (MANIFEST_VERSION, key)
+    self.input = os.path.normpath(input)
+    self.inputs = {}
+    self.old = {}
+    self.new = {}
+    self.unchanged = []
+    self.changed = []
+    self.added = []
+    self.removed = []
+
+    if os.path.exists(path):
+      try:
+        f = open(path, 'r')
+        data = json.load(f)
+        f.close()
+      except ValueError:
+        print('[!] ignoring unreadable manifest ' + path)
+        data = {}
+      if data.get('key') == self.key:
+        self.inputs = data.get('inputs', {})
+        self.old = self.inputs.get(self.input, {})
+      else:
+        print('[i] manifest was written with different settings, regenerating everything')
+
+  def is_current(self, output, digest):
+    return self.old.get(output) == digest and os.path.exists(output)
+
+  def record(self, output, digest):
+    if output not in self.old:
+      self.added.append(output)
+    elif self.old[output] == digest and os.path.exists(output):
+      self.unchanged.append(output)
+    else:
+      self.changed.append(output)
+    self.new[output] = digest
+
+  def finish(self):
+    # outputs another input still lists are left alone
+    others = set()
+    for input, outputs in self.inputs.items():
+      if input != self.input:
+        others.update(outputs)
+    for output in sorted(set(self.old) - set(self.new)):
+      self.removed.append(output)
+      if output not in others and os.path.exists(output):
+        os.remove(output)
+
+    self.inputs[self.input] = self.new
+    f = open(self.path, 'w')
+    json.dump({'key': self.key, 'inputs': self.inputs}, f, indent=1, sort_keys=True,
+              separators=(', ', ': '))
+    f.write("\n")
+    f.close()
+
+  def report(self):
+    for output in self.added:
+      print("[i]    new: " + output)
+    for output in self.changed:
+      print("[i]    changed: " + output)
+    for output in self.removed:
+      print("[i]    removed: " + output)
+    print("[i] manifest: %u unchanged, %u changed, %u new, %u removed" % \
+      (len(self.unchanged), len(self.changed), len(self.added), len(self.removed)))
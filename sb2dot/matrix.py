@@ -0,0 +1,80 @@
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: matrix.py
+# task: profile x operation decision matrix (--format matrix-csv)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import graphstats
+import stats
+import summary
+
+MATRIX_COLUMNS = ['file', 'profile', 'operation', 'decision', 'result', 'nodes']
+
+def reachable_counts(g, roots):
+  """ number of nodes reachable from every root in one bottom-up pass """
+  order, parents = graphstats.walk(g, roots)
+  bit, sets = graphstats.reachable_sets(g, order, parents, roots)
+  return dict([(root, graphstats.popcount(sets[root])) for root in sets])
+
+def decision(terms):
+  if summary.is_unconditional(terms):
+    return summary.verdict(terms)
+  return 'conditional'
+
+def matrix_rows(g, groups, op_names, selected_ops=None):
+  """ groups as returned by group_optable(), returns one row per operation
+      in operation table order. Operations sharing the graph of the
+      default operation are 'default'. """
+  roots = [op_offset * 8 for op_offset, name, clean_name, ops in groups]
+  with stats.phase('summary'):
+    summaries = summary.reachable_terminals(g, roots)
+  with stats.phase('matrix'):
+    counts = reachable_counts(g, roots)
+  rows = []
+  for op_offset, name, clean_name, ops in groups:
+    terms = summaries[op_offset * 8]
+    for op_idx in ops:
+      if selected_ops is not None and op_idx not in selected_ops:
+        continue
+      if name == 'default' and op_idx != 0:
+        d = 'default'
+      else:
+        d = decision(terms)
+      rows.append((op_idx, (op_names[op_idx], d, summary.summary_label(terms), counts[op_offset * 8])))
+  rows.sort()
+  return [row for op_idx, row in rows]
+
+class MatrixWriter(object):
+  """ writes the rows of every profile as soon as it has been decoded,
+      source is the profile file the next profiles come from """
+  def __init__(self, f):
+    self.f = f
+    self.source = ''
+    f.write(",".join(MATRIX_COLUMNS) + "\n")
+
+  def add(self, profile_name, rows):
+    prefix = graphstats.csv_quote(self.source) + "," + graphstats.csv_quote(profile_name) + ","
+    for row in rows:
+      self.f.write(prefix + ",".join([graphstats.csv_quote(v) for v in row]) + "\n")
+      if stats.enabled:
+        stats.count('matrix_rows')
+
+  def close(self):
+    self.f.flush()
@@ -1,83 +1,266 @@
-#
-# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
-# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
-#    uses and extends code from Dionysus Blazakis with his permission
-#
-# module: outputdot.py
-# task: cheap .dot file generator 
-#
-# This program is free software; you can redistribute it and/or modify
-# it under the terms of the GNU General Public License as published by
-# the Free Software Foundation; either version 2 of the License, or
-# (at your option) any later version.
-#
-# This program is distributed in the hope that it will be useful,
-# but WITHOUT ANY WARRANTY; without even the implied warranty of
-# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
-# GNU General Public License for more details.
-#
-# You should have received a copy of the GNU General Public License along
-# with this program; if not, write to the Free Software Foundation, Inc.,
-# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
-#
-
-import os
-
-def dump_node_to_dot(g, u, visited):
-
-    if visited.has_key(u):
-        return ""
-    tag = g.getTag(u)
-    tag = str(tag)
-    tag = tag.replace("\\", "\\\\")
-    tag = tag.replace("\"", "\\\"")
-    tag = tag.replace("\0", "")
-    edges = list(g.edges[u])
-    
-    visited[u] = True;
-    out = "n%u [label=\"%s\"];\n" % (u, tag)
-    
-    if len(edges) == 0:
-        return out
-    
-    out+= "n%u -> n%u [color=\"green\"];\n" % (u, edges[0]);
-    out+= "n%u -> n%u [color=\"red\"];\n" % (u, edges[1]);
-    
-    out+=dump_node_to_dot(g, edges[0], visited)
-    out+=dump_node_to_dot(g, edges[1], visited)
-    
-    return out;
-
-def dump_to_dot(g, offset, name, cleanname, profile_name):
-    u = offset * 8
-    visited = {}
-    
-    orig_name = name
-    
-    if len(name) > 128:
-        name = name[0:128]
-    name = name + ".dot"
-    name = name.replace("*", "")
-    name = name.replace(" ", "_")
-    
-    cleanname = cleanname.replace("\\", "\\\\")
-    cleanname = cleanname.replace("\"", "\\\"")
-    cleanname = cleanname.replace("\0", "")
-    
-    profile_name = os.path.basename(profile_name)
-    profile_name = profile_name.replace("\\", "\\\\")
-    profile_name = profile_name.replace("\"", "\\\"")
-    profile_name = profile_name.replace("\0", "")
-    
-    
-    f = open(profile_name + "_" + name, 'w')
-    print "[+]    generating " + profile_name + "_" + name
-    
-    f.write("digraph sandbox_decision { rankdir=HR; labelloc=\"t\";label=\"sandbox decision graph for\n\n%s\n\nextracted from %s\n\n\n\"; \n" % (cleanname, profile_name))
-    out = "n0 [label=\"%s\";shape=\"doubleoctagon\"];\n" % (cleanname)
-    out+= "n0 -> n%u [color=\"black\"];\n" % (u);
-    out = out + dump_node_to_dot(g, u, visited)
-    f.write(out)
-    f.write("} \n")
-    
-    f.close()
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: outputdot.py
+# task: cheap .dot file generator 
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+from __future__ import print_function
+import os
+import gzip
+import cache
+import compat
+import stats
+import partition
+import slicing
+import summary
+
+try:
+  from cStringIO import StringIO
+except ImportError:
+  from io import BytesIO as StringIO
+
+def dump_stub_to_dot(u, tag, filename):
+    return "n%u [label=\"%s\\n\\ncontinued in %s\";shape=\"box\";style=\"dashed\";URL=\"%s\"];\n" % (u, tag, filename, filename)
+
+def edge_colors(g, u):
+    # both successors of a sliced away filter are possible outcomes
+    if g.getTag(u) is slicing.DONT_CARE:
+        return "gray", "gray"
+    return "green", "red"
+
+def dump_node_to_dot(g, u, visited, stubs=None):
+
+    if u in visited:
+        return ""
+    tag = g.getTag(u)
+    tag = str(tag)
+    tag = tag.replace("\\", "\\\\")
+    tag = tag.replace("\"", "\\\"")
+    tag = tag.replace("\0", "")
+    if node_summaries is not None and g.edges[u]:
+        tag += "\\n[%s]" % summary.summary_label(node_summaries[u])
+    edges = list(g.edges[u])
+    
+    visited[u] = True;
+    if stubs is not None and u in stubs:
+        return dump_stub_to_dot(u, tag, stubs[u])
+    out = "n%u [label=\"%s\"];\n" % (u, tag)
+    
+    if len(edges) == 0:
+        return out
+    
+    green, red = edge_colors(g, u)
+    out+= "n%u -> n%u [color=\"%s\"];\n" % (u, edges[0], green);
+    out+= "n%u -> n%u [color=\"%s\"];\n" % (u, edges[1], red);
+    
+    out+=dump_node_to_dot(g, edges[0], visited, stubs)
+    out+=dump_node_to_dot(g, edges[1], visited, stubs)
+    
+    return out;
+
+def collect_nodes(g, u, stubs=None):
+    """ nodes reachable from u in the order dump_node_to_dot visits them """
+    order = []
+    visited = set()
+    stack = [u]
+    while stack:
+        u = stack.pop()
+        if u in visited:
+            continue
+        visited.add(u)
+        order.append(u)
+        if stubs is not None and u in stubs:
+            continue
+        edges = list(g.edges[u])
+        if len(edges) == 1:
+            edges = edges * 2
+        stack.extend(reversed(edges))
+    return order
+
+def compact_label(tag, terms):
+    if terms is None:
+        return dot_escape(str(tag))
+    return dot_escape(str(tag)) + "\\n[%s]" % summary.summary_label(terms)
+
+def dump_graph_compact(g, u, labels, stubs=None):
+    """ every distinct label is written once for all nodes carrying it and
+        edges are grouped by color, attributes come from subgraph defaults """
+    order = collect_nodes(g, u, stubs)
+    groups = {}
+    group_order = []
+    green = []
+    red = []
+    gray = []
+    out = []
+    for u in order:
+        tag = g.getTag(u)
+        terms = None
+        if node_summaries is not None and g.edges[u]:
+            terms = node_summaries[u]
+        label = labels.get((tag, terms))
+        if label is None:
+            label = compact_label(tag, terms)
+            labels.put((tag, terms), label)
+        if stubs is not None and u in stubs:
+            out.append(dump_stub_to_dot(u, label, stubs[u]))
+            continue
+        if label in groups:
+            groups[label].append(u)
+        else:
+            groups[label] = [u]
+            group_order.append(label)
+        edges = list(g.edges[u])
+        if len(edges) == 0:
+            continue
+        if len(edges) == 1:
+            edges = edges * 2
+        if tag is slicing.DONT_CARE:
+            gray.append("n%u->n%u" % (u, edges[0]))
+            gray.append("n%u->n%u" % (u, edges[1]))
+            continue
+        green.append("n%u->n%u" % (u, edges[0]))
+        red.append("n%u->n%u" % (u, edges[1]))
+
+    for label in group_order:
+        out.append("{node [label=\"%s\"] %s}\n" % (label, " ".join(["n%u" % n for n in groups[label]])))
+    if green:
+        out.append("{edge [color=\"green\"] %s}\n" % " ".join(green))
+        out.append("{edge [color=\"red\"] %s}\n" % " ".join(red))
+    if gray:
+        out.append("{edge [color=\"gray\"] %s}\n" % " ".join(gray))
+    return "".join(out), len(order)
+
+# if set, generated graphs are handed to output_sink.add(filename, data)
+# instead of being written to individual files (see archive.py)
+output_sink = None
+
+# --compact selects dump_graph_compact(), --gzip compresses every graph
+compact = False
+gzip_output = False
+
+# split graphs larger than this many nodes into linked parts (--partition)
+partition_budget = None
+
+# reachable terminals by node (summary.py), shown in the labels if set
+node_summaries = None
+
+# rendered labels by (tag object, summary), tags are shared flyweights
+# (filters.py). Cleared with the filter pools for every file, an LRUCache
+# like them with --stream.
+compact_labels = cache.Pool()
+
+def gzip_data(data):
+    buf = StringIO()
+    # fixed mtime so unchanged graphs give byte identical files
+    z = gzip.GzipFile(fileobj=buf, mode='wb', mtime=0)
+    z.write(data)
+    z.close()
+    return buf.getvalue()
+
+def dot_escape(s):
+    s = s.replace("\\", "\\\\")
+    s = s.replace("\"", "\\\"")
+    s = s.replace("\0", "")
+    return s
+
+def dot_filename(name, profile_name):
+    if len(name) > 128:
+        name = name[0:128]
+    name = name + ".dot"
+    if gzip_output:
+        name = name + ".gz"
+    name = name.replace("*", "")
+    name = name.replace(" ", "_")
+    
+    profile_name = dot_escape(os.path.basename(profile_name))
+    return profile_name + "_" + name
+
+def part_name(name, part):
+    if part == 0:
+        return name
+    return name + "_part%u" % part
+
+def dump_partitioned(g, offset, name, cleanname, profile_name):
+    parts = partition.partition_graph(g, offset * 8, partition_budget)
+    if len(parts) == 1:
+        return dump_to_dot(g, offset, name, cleanname, profile_name, {})
+
+    filenames = {}
+    for i, (root, nodes, stubs) in enumerate(parts):
+        filenames[root] = dot_filename(part_name(name, i), profile_name)
+    for i, (root, nodes, stubs) in enumerate(parts):
+        part_stubs = dict([(u, filenames[u]) for u in stubs])
+        title = cleanname
+        if i > 0:
+            title = cleanname + "\n(part %u of %u)" % (i, len(parts) - 1)
+        dump_to_dot(g, root // 8, part_name(name, i), title, profile_name, part_stubs)
+    if stats.enabled:
+        stats.count('partitioned_graphs')
+        stats.count('graph_parts', len(parts))
+
+def render_dot(g, offset, cleanname, profile_name, stubs=None):
+    """ returns the graph header, the graph body and the node count """
+    u = offset * 8
+    visited = {}
+    
+    cleanname = dot_escape(cleanname)
+    profile_name = dot_escape(os.path.basename(profile_name))
+    
+    header = "digraph sandbox_decision { rankdir=HR; labelloc=\"t\";label=\"sandbox decision graph for\n\n%s\n\nextracted from %s\n\n\n\"; \n" % (cleanname, profile_name)
+    out = "n0 [label=\"%s\";shape=\"doubleoctagon\"];\n" % (cleanname)
+    if compact:
+        # node defaults only apply to nodes created after them, so the
+        # labelled groups have to come before the first edge
+        body, count = dump_graph_compact(g, u, compact_labels, stubs)
+        out+= body
+        out+= "n0 -> n%u [color=\"black\"];\n" % (u);
+    else:
+        out+= "n0 -> n%u [color=\"black\"];\n" % (u);
+        out = out + dump_node_to_dot(g, u, visited, stubs)
+        count = len(visited)
+    return header, out, count
+
+def dump_to_dot(g, offset, name, cleanname, profile_name, stubs=None):
+    if stubs is None and partition_budget is not None:
+        return dump_partitioned(g, offset, name, cleanname, profile_name)
+
+    filename = dot_filename(name, profile_name)
+    print("[+]    generating " + filename)
+    header, out, count = render_dot(g, offset, cleanname, profile_name, stubs)
+    
+    if output_sink is not None or gzip_output:
+      data = compat.binary(header + out + "} \n")
+      if gzip_output:
+        data = gzip_data(data)
+      if output_sink is not None:
+        output_sink.add(filename, data)
+      else:
+        f = open(filename, 'wb')
+        f.write(data)
+        f.close()
+    else:
+      f = compat.open_text(filename, 'w')
+      f.write(header)
+      f.write(out)
+      f.write("} \n")
+      f.close()
+    if stats.enabled:
+      stats.count('dot_files')
+      stats.count('dot_nodes', count)
@@ -0,0 +1,107 @@
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: partition.py
+# task: splits oversized decision graphs into parts below a node budget
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import graphstats
+
+def part_nodes(g, root, cuts):
+  """ nodes reachable from root without walking through other cut nodes """
+  nodes = set([root])
+  stack = [root]
+  while stack:
+    u = stack.pop()
+    if u != root and u in cuts:
+      continue
+    for v in g.edges[u]:
+      if v not in nodes:
+        nodes.add(v)
+        stack.append(v)
+  return nodes
+
+def pick_cuts(g, root, budget):
+  """ the cut nodes, chosen in one bottom-up pass
+
+      The nodes below every node are a bit set over the post-order built
+      from the sets of its children, a cut child only adds itself (it
+      becomes a stub). A node whose set grows over the budget cuts its
+      children, shared ones and the ones covering most first, until it
+      fits. Cuts only ever shrink the sets seen before, so every part
+      stays within the budget unless a single node has too many children.
+  """
+  order, parents = graphstats.walk(g, [root])
+  bit = dict([(u, i) for i, u in enumerate(order)])
+  pending = dict([(u, len(parents[u])) for u in order])
+  cuts = set()
+  # nodes below every node whose parents are not all done yet
+  below = {}
+  sizes = {}
+  for u in order:
+    children = g.edges.get(u, ())
+    s = 1 << bit[u]
+    for v in children:
+      s |= below[v]
+    size = graphstats.popcount(s)
+    if size > budget:
+      # cutting at a terminal would only replace it by a stub
+      candidates = [v for v in children if v not in cuts and g.edges.get(v)]
+      # shared nodes first: cutting there removes the subgraph below it
+      # from every parent at once
+      candidates.sort(key=lambda v: (len(parents[v]) > 1,
+                                     len(parents[v]) * min(sizes[v], budget), -v),
+                      reverse=True)
+      for v in candidates:
+        cuts.add(v)
+        below[v] = 1 << bit[v]
+        s = 1 << bit[u]
+        for w in children:
+          s |= below[w]
+        size = graphstats.popcount(s)
+        if size <= budget:
+          break
+    below[u] = s
+    sizes[u] = size
+    for v in children:
+      pending[v] -= 1
+      if pending[v] == 0:
+        del below[v]
+  return cuts
+
+def partition_graph(g, root, budget):
+  """ returns a list of (part root, part nodes, stub nodes), the first part
+      starts at root. Every stub is the root of another part. """
+  cuts = pick_cuts(g, root, budget)
+  parts = []
+  done = set()
+  pending = [root]
+  while pending:
+    r = pending.pop(0)
+    if r in done:
+      continue
+    done.add(r)
+
+    nodes = part_nodes(g, r, cuts)
+    stubs = set([u for u in nodes if u != r and u in cuts])
+    parts.append((r, nodes, stubs))
+    for u in sorted(stubs):
+      if u not in done:
+        pending.append(u)
+  return parts
@@ -0,0 +1,120 @@
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: pathmatch.py
+# task: decides all path filters of an operation in one scan
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import compat
+import filters
+import regexdfa
+import stats
+
+# trie key of the literal filters ending at a trie node
+END = -1
+
+def path_tags(g, root):
+  """ distinct literal and regex path filter tags below root. The
+      mount-relative-path and mount-relative-regex filters are left out,
+      they match against the path below the mount point of its volume,
+      which a path alone does not tell. """
+  tags = []
+  seen = set()
+  visited = set([root])
+  stack = [root]
+  while stack:
+    u = stack.pop()
+    tag = g.getTag(u)
+    if tag not in seen and isinstance(tag, (filters.LiteralFilter, filters.RegexFilter)):
+      seen.add(tag)
+      tags.append(tag)
+    for v in g.edges[u]:
+      if v not in visited:
+        visited.add(v)
+        stack.append(v)
+  return tags
+
+class PathMatcher(object):
+  """ precompiled matcher for the path filters below one operation. The
+      literals are kept in a trie and the regexes run as one product DFA
+      (regexdfa.MultiMatcher), match() walks both in a single scan. Regexes
+      without usable bytecode and the mount-relative filters (see
+      path_tags()) are left out and must be decided otherwise. """
+  def __init__(self, g, root):
+    self.trie = {}
+    self.literals = []
+    self.regexes = []
+    nfas = []
+    by_bytecode = {}
+    for tag in path_tags(g, root):
+      if isinstance(tag, filters.LiteralFilter):
+        node = self.trie
+        for c in bytearray(compat.binary(tag.s.rstrip('\0'))):
+          node = node.setdefault(c, {})
+        node.setdefault(END, []).append(tag)
+        self.literals.append(tag)
+      elif tag.bytecode is not None:
+        # equal bytecode in several tags runs only once
+        idx = by_bytecode.get(tag.bytecode)
+        if idx is None:
+          nfa = regexdfa.compile_nfa(tag.bytecode)
+          if nfa is None:
+            continue
+          idx = by_bytecode[tag.bytecode] = len(nfas)
+          nfas.append(nfa)
+        self.regexes.append((tag, idx))
+    self.multi = None
+    if nfas:
+      self.multi = regexdfa.MultiMatcher(nfas)
+    if stats.enabled:
+      stats.count('path_matchers')
+
+  def match(self, path):
+    """ returns {tag: matched} for the path filters decided by path """
+    node = self.trie
+    multi = self.multi
+    n = 0
+    if multi is not None:
+      tables = multi.tables
+      rows, done = tables[1], tables[3]
+      scanning = not done[0]
+    else:
+      scanning = False
+    for c in bytearray(path):
+      if node is not None:
+        node = node.get(c)
+      if scanning:
+        t = rows[n][c]
+        if t < 0:
+          tables, t = multi.transition(tables, n, c)
+          rows, done = tables[1], tables[3]
+        n = t
+        scanning = not done[n]
+      elif node is None:
+        break
+
+    results = dict.fromkeys(self.literals, False)
+    if node is not None:
+      for tag in node.get(END, ()):
+        results[tag] = True
+    if multi is not None:
+      matched = tables[2][n]
+      for tag, idx in self.regexes:
+        results[tag] = idx in matched
+    return results
@@ -1,360 +1,510 @@
-#
-# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
-# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
-#    uses and extends code from Dionysus Blazakis with his permission
-#
-# module: redis.py
-# task: regular expression disassembly
-#
-# This program is free software; you can redistribute it and/or modify
-# it under the terms of the GNU General Public License as published by
-# the Free Software Foundation; either version 2 of the License, or
-# (at your option) any later version.
-#
-# This program is distributed in the hope that it will be useful,
-# but WITHOUT ANY WARRANTY; without even the implied warranty of
-# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
-# GNU General Public License for more details.
-#
-# You should have received a copy of the GNU General Public License along
-# with this program; if not, write to the Free Software Foundation, Inc.,
-# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
-#
-
-import struct
-import cStringIO
-from minigraph import *
-
-def hexdump(_str):
-    cnt = len(_str)
-    
-    for i in range(cnt):
-        c = ord(_str[i])
-        print ("%02x " % ord(_str[i])),
-        if (c < 32):
-            c = 0x2e
-        if (c > 127):
-            c = 0x2e
-        if ((i+1) % 16 == 0):
-            print ""
-        
-    print ""
-    for i in range(cnt):
-        c = ord(_str[i])
-        if (c < 32):
-            c = 0x2e
-        if (c > 127):
-            c = 0x2e
-        print ("%c" % c),
-        if ((i+1) % 16 == 0):
-            print ""
-    print ""
-    print ""
-
-
-class CharMask(object):
-    
-  def __init__(self, mask=None):
-    self.mask = {}
-    self.invert = False
-    for i in range(256):
-      self.mask[i] = False
-      
-  def addFromTo(self, f, t):
-    f = ord(f)
-    t = ord(t)
-    if f > t:
-      t = t + 256
-      self.invert = True
-      
-    for i in range(f, t+1):
-      self.mask[i % 256] = True
-  
-  def invertmask(self):
-    mask = {}
-    for i in range(256):
-      mask[i] = not self.mask[i]
-    return mask
-
-  def __repr__(self):
-    if self.invert:
-      mask = self.invertmask()
-      prefix = "^"
-    else:
-      mask = self.mask
-      prefix = ""
-    
-    pattern = ""
-    i = 0
-    while True:
-      # search until next allowed pattern
-      while i < 256 and mask[i] == False:
-        i = i + 1
-      if i == 256:
-        break
-      
-      f = i
-      t = f
-      while i < 256 and mask[i] == True:
-        t = i
-        i = i + 1
-      
-      #print f,t
-      if f == t:
-        if f == ord("-"):
-          pattern = "-" + pattern
-        else:
-          pattern = pattern + chr(f)
-      elif f == t - 1:
-        pattern = pattern + chr(f) + chr(t)
-      else:
-        pattern = pattern + chr(f) + "-" + chr(t)
-      
-    
-    return "[" + prefix + pattern + "]"
-
-
-def maybe_escape(s):
-  if s in '^$.?*[]()':
-    return '\\' + s
-  else:
-    return s
-
-
-def reToGraph(re):
-  f = cStringIO.StringIO(re)
-  version = struct.unpack('>I', f.read(4))
-  #print "version: %08x" % version[0]
-  if version[0] != 3:
-    print 'This is an old regular expression. Cannot handle this.'
-    return None
-
-  # TODO: need to find the bug that sometimes regular expression decoding results in NULL
-  #hexdump(re)
-
-  g = MiniGraph()
-  mlen = struct.unpack('<H', f.read(2))
-  mlen = mlen[0]
-  idx = 0
-  while True:
-    idx = f.tell()-6
-    if mlen == idx:
-        break
-            
-    typ = ord(f.read(1))
-    if typ & 0xf == 10:
-        typ = 10
-    if typ == 0x2f:
-      target = struct.unpack('<H', f.read(2))
-      g.addEdge(idx, target[0])
-      g.addEdge(idx, idx+3)
-      g.setTag(idx, (typ, None))
-    elif typ == 0x0a:
-      target = struct.unpack('<H', f.read(2))
-      g.addEdge(idx, target[0])
-      #g.addEdge(idx, idx+3)
-      g.setTag(idx, (typ, None))
-    elif typ == 0x15:
-      # unsure overread
-      f.read(1)
-      g.setTag(idx, (typ, None))
-    elif typ == 0x19:
-      g.addEdge(idx, idx+1)
-      g.setTag(idx, (0x100, "^"))
-    elif typ == 0x29:
-      g.addEdge(idx, idx+1)
-      g.setTag(idx, (0x100, "$"))
-    elif typ == 0x02:
-      g.addEdge(idx, idx+2)
-      g.setTag(idx, (0x100, maybe_escape(chr(ord(f.read(1)) & 0xff))))
-    elif typ == 0x09:
-      g.addEdge(idx, idx+1)
-      g.setTag(idx, (0x100, "."))
-    elif (typ & 0xf) == 0xb:
-      cmask = CharMask()
-      
-      cnt = typ >> 4
-      for i in range(cnt):
-          c1 =  f.read(1)
-          c2 =  f.read(1)
-          cmask.addFromTo(c1, c2)
-
-      g.addEdge(idx, idx+1+cnt*2)
-      g.setTag(idx, (0x100, str(cmask)))
-    else:
-      print "ILLEGAL TYPE"
-      print "idx: %08x" % idx
-      print "typ: %02x" % typ
-      break
-  
-  return g
-
-def eliminateDummyEdges(g):
-    
-    for u, adjs in g.edges.items():
-        
-        utag = g.getTag(u)
-        if utag == None:
-            continue
-        t,d = utag
-        if t == 0x2f:
-            for v in adjs:
-                vtag = g.getTag(v)
-                if vtag != None:
-                    t,d = vtag
-                    if t == 0x0a:
-                        edges = list(g.edges[v])
-                        for e in edges:
-                            g.addEdge(u, e)
-                        g.removeNode(v)                    
-
-
-def graphToRegEx(g):
-  # Merge adjacents and pattern match for RE ops
-  done = False
-  #g.pprint()
-  eliminateDummyEdges(g)
-  #g.pprint()
-  while not done:
-    done = True
-    for u, adjs in g.edges.items():
-      utag = g.getTag(u)
-      for v in adjs:
-        if g.mergeIfPossible(u, v):
-          done = False
-          break
-      if not done:
-        break
-
-  done = False
-  
-
-  while not done:
-    done = True
-    for u, adjs in g.edges.items():
-      utag = g.getTag(u)
-      
-      # Get rid of "ACCEPT" nodes
-      if utag is not None and utag[0] == 0x15:
-        g.removeNode(u)
-        done = False
-        break
-        
-      # Try to match *
-      if utag is not None and utag[0] in [0x2F] and len(adjs) == 2:
-        v_left = list(adjs)[0]
-        v_right = list(adjs)[1]
-        v_lefttag = g.getTag(v_left)
-        v_righttag = g.getTag(v_right)
-        
-
-        if v_lefttag is not None and v_lefttag[0] == 0x100:
-          if g.edges[v_left] == set([u]) and g.redges[v_left] == set([u]):       
-            g.removeEdge(u, v_left)
-            g.removeNode(v_left)
-            g.setTag(u, (0x100, '(' + v_lefttag[1] + ')*'))
-            done = False
-            break
-          elif u in g.edges[v_left] and len(g.redges[v_left]) == 2 and \
-               u in g.redges[v_left]:
-            entry = list(g.redges[v_left] - set([u]))[0]
-            g.removeEdge(entry, v_left)
-            g.removeEdge(u, v_left)
-            g.removeNode(v_left)
-            g.addEdge(entry, u)
-            g.setTag(u, (0x100, '(' + v_lefttag[1] + ')+'))
-            done = False
-            break
-          
-        if v_righttag is not None and v_righttag[0] == 0x100:
-          if g.edges[v_right] == set([u]) and g.redges[v_right] == set([u]):
-            g.removeEdge(u, v_right)
-            g.removeNode(v_right)
-            g.setTag(u, (0x100, '(' + v_righttag[1] + ')*'))
-            done = False
-            break
-          elif u in g.edges[v_right] and len(g.redges[v_right]) == 2 and \
-               u in g.redges[v_right]:
-            entry = list(g.redges[v_right] - set([u]))[0]
-            g.removeEdge(entry, v_right)
-            g.removeEdge(u, v_right)
-            g.removeNode(v_right)
-            g.addEdge(entry, u)
-            g.setTag(u, (0x100, '(' + v_righttag[1] + ')+'))
-            done = False
-            break
-
-      # Try to match | and ?
-      if utag is not None and utag[0] in [0x2F] and len(adjs) == 2:
-        v_left = list(adjs)[0]
-        v_right = list(adjs)[1]
-        v_lefttag = g.getTag(v_left)
-        v_righttag = g.getTag(v_right)
-
-        # Match |
-        if v_lefttag is not None and v_lefttag[0] == 0x100 and \
-           v_righttag is not None and v_righttag[0] == 0x100:
-          vl_next = g.edges[v_left]
-          vr_next = g.edges[v_right]
-
-          if len(vl_next) <= 1 and len(vr_next) <= 1 and \
-             vl_next == vr_next:
-            g.removeEdge(u, v_left)
-            g.removeEdge(u, v_right)
-            if len(vl_next) == 1:
-              join_node = list(vl_next)[0]
-              g.addEdge(u, join_node)
-            g.removeNode(v_left)
-            g.removeNode(v_right)
-            g.setTag(u, (0x100, '(' + v_lefttag[1] + '|' + v_righttag[1] + ')'))
-            done = False
-            break
-
-        # Match ?
-        if v_lefttag is not None and v_lefttag[0] == 0x100 and \
-           v_righttag is not None:
-          vl_next = g.edges[v_left]
-          if len(vl_next) == 1 and list(vl_next)[0] == v_right:
-            g.removeEdge(u, v_left)
-            g.removeEdge(u, v_right)
-            g.addEdge(u, v_right)
-            g.removeNode(v_left)
-            g.removeNode(v_right)
-            g.setTag(u, (0x100, '(' + v_lefttag[1] + ')?'))
-            done = False
-            break
-
-        if v_lefttag is not None and \
-           v_righttag is not None and v_righttag[0] == 0x100:
-          vr_next = g.edges[v_right]
-          if len(vr_next) == 1 and list(vr_next)[0] == v_left:
-            g.removeEdge(u, v_left)
-            g.removeEdge(u, v_right)
-            g.addEdge(u, v_left)
-            g.removeNode(v_left)
-            g.removeNode(v_right)
-            g.setTag(u, (0x100, '(' + v_righttag[1] + ')?'))
-            done = False
-            break
-
-      if utag is not None and utag[0] == 0x31:
-        for v in g.edges[u]:
-          for uu in g.redges[u]:
-            g.addEdge(uu, v)
-        g.removeNode(u)
-        done = False
-        break
-
-      # Merge constants if possible
-      for v in adjs:
-        if g.mergeIfPossible(u, v):
-          done = False
-          break
-      if not done:
-        break
-
-  #g.pprint()
-  if len(g.nodes) == 1:
-    return g.getTag(list(g.nodes)[0])[1]
-  else:
-    return None
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: redis.py
+# task: regular expression disassembly
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+from __future__ import print_function
+import struct
+import compat
+import hashorder
+import stats
+import cache
+from minigraph import *
+
+try:
+  from cStringIO import StringIO
+except ImportError:
+  from io import BytesIO as StringIO
+
+def hexdump(_str):
+    _str = bytearray(_str)
+    cnt = len(_str)
+    
+    for i in range(cnt):
+        c = _str[i]
+        print("%02x " % _str[i], end=' ')
+        if (c < 32):
+            c = 0x2e
+        if (c > 127):
+            c = 0x2e
+        if ((i+1) % 16 == 0):
+            print("")
+        
+    print("")
+    for i in range(cnt):
+        c = _str[i]
+        if (c < 32):
+            c = 0x2e
+        if (c > 127):
+            c = 0x2e
+        print("%c" % c, end=' ')
+        if ((i+1) % 16 == 0):
+            print("")
+    print("")
+    print("")
+
+
+FULL_MASK = (1 << 256) - 1
+
+# rendered character classes, keyed by (bits, invert). Bounded, a long
+# --stream or --serve run meets an open ended number of classes.
+mask_strings = cache.LRUCache(4096, 'mask_lru')
+
+class CharMask(object):
+  """ 256 bit character class, bit i is set if chr(i) is in the class """
+    
+  def __init__(self, mask=None):
+    self.mask = 0
+    self.invert = False
+      
+  def addFromTo(self, f, t):
+    self.addRange(ord(f), ord(t))
+
+  def addRange(self, f, t):
+    if f > t:
+      # wraps around: f..255 and 0..t
+      self.invert = True
+      self.mask |= (FULL_MASK >> f) << f
+      self.mask |= (1 << (t + 1)) - 1
+    else:
+      self.mask |= ((1 << (t - f + 1)) - 1) << f
+  
+  def invertmask(self):
+    return ~self.mask & FULL_MASK
+
+  def render(self):
+    if self.invert:
+      mask = self.invertmask()
+      prefix = "^"
+    else:
+      mask = self.mask
+      prefix = ""
+
+    pattern = ""
+    i = 0
+    while mask:
+      # skip to the next set bit and measure the run of ones starting there
+      low = (mask & -mask).bit_length() - 1
+      mask >>= low
+      run = ((mask ^ (mask + 1)) >> 1).bit_length()
+      mask >>= run
+      f = i + low
+      t = f + run - 1
+      i = t + 1
+
+      #print f,t
+      if f == t:
+        if f == ord("-"):
+          pattern = "-" + pattern
+        else:
+          pattern = pattern + chr(f)
+      elif f == t - 1:
+        pattern = pattern + chr(f) + chr(t)
+      else:
+        pattern = pattern + chr(f) + "-" + chr(t)
+
+    return "[" + prefix + pattern + "]"
+
+  def __repr__(self):
+    key = (self.mask, self.invert)
+    s = mask_strings.get(key)
+    if s is None:
+      s = self.render()
+      mask_strings.put(key, s)
+    return s
+
+
+def maybe_escape(s):
+  if s in '^$.?*[]()':
+    return '\\' + s
+  else:
+    return s
+
+
+# bytecode decoder: one handler per opcode. Each handler gets the
+# bytecode buffer, the position of the opcode in the buffer and the node id
+# (position relative to the start of the program), appends a
+# (node, successors, tag) tuple to prog and returns the position of the
+# next opcode. The graph is built from prog in one go afterwards.
+
+RE_HEADER_SIZE = 6
+
+def re_op_split(prog, buf, i, idx):
+  prog.append((idx, (buf[i+1] | (buf[i+2] << 8), idx+3), (0x2f, None)))
+  return i + 3
+
+def re_op_jump(prog, buf, i, idx):
+  prog.append((idx, (buf[i+1] | (buf[i+2] << 8),), (0x0a, None)))
+  return i + 3
+
+def re_op_accept(prog, buf, i, idx):
+  # unsure overread
+  prog.append((idx, (), (0x15, None)))
+  return i + 2
+
+def re_op_bol(prog, buf, i, idx):
+  prog.append((idx, (idx+1,), (0x100, "^")))
+  return i + 1
+
+def re_op_eol(prog, buf, i, idx):
+  prog.append((idx, (idx+1,), (0x100, "$")))
+  return i + 1
+
+def re_op_char(prog, buf, i, idx):
+  prog.append((idx, (idx+2,), (0x100, RE_CHARS[buf[i+1]])))
+  return i + 2
+
+def re_op_any(prog, buf, i, idx):
+  prog.append((idx, (idx+1,), (0x100, ".")))
+  return i + 1
+
+def re_op_class(prog, buf, i, idx):
+  cmask = CharMask()
+  cnt = buf[i] >> 4
+  j = i + 1
+  end = j + cnt*2
+  while j < end:
+    cmask.addRange(buf[j], buf[j+1])
+    j += 2
+  prog.append((idx, (idx+1+cnt*2,), (0x100, str(cmask))))
+  return end
+
+RE_CHARS = [maybe_escape(chr(c)) for c in range(256)]
+
+RE_OPS = [None] * 256
+RE_OPS[0x2f] = re_op_split
+RE_OPS[0x15] = re_op_accept
+RE_OPS[0x19] = re_op_bol
+RE_OPS[0x29] = re_op_eol
+RE_OPS[0x02] = re_op_char
+RE_OPS[0x09] = re_op_any
+# the high nibble of a jump is not used, the original decoder took any 0x?a
+for typ in range(0x0a, 0x100, 0x10):
+  RE_OPS[typ] = re_op_jump
+for typ in range(0x0b, 0x100, 0x10):
+  RE_OPS[typ] = re_op_class
+
+class RegexGraph(MiniGraph):
+  # the reductions in graphToRegEx() take the first match in iteration
+  # order, Python 3 has to iterate like Python 2 to give the same regexes
+  if compat.PY3:
+    adjacency_map = hashorder.IntDict
+    adjacency_set = hashorder.IntSet
+
+def progToGraph(prog):
+  # same insertion order as calling addEdge() for every edge in turn
+  g = RegexGraph()
+  adjacency_set = g.adjacency_set
+  nodes = g.nodes
+  edges = g.edges
+  redges = g.redges
+  tags = g.tags
+  for u, succ, tag in prog:
+    tags[u] = tag
+    if not succ:
+      continue
+    out = edges.get(u)
+    if out is None:
+      nodes.add(u)
+      out = edges[u] = adjacency_set()
+      redges[u] = adjacency_set()
+    for v in succ:
+      into = redges.get(v)
+      if into is None:
+        nodes.add(v)
+        edges[v] = adjacency_set()
+        into = redges[v] = adjacency_set()
+      out.add(v)
+      into.add(u)
+  return g
+
+def reToGraph(re):
+  buf = bytearray(re)
+  version = struct.unpack_from('>I', buf)
+  #print "version: %08x" % version[0]
+  if version[0] != 3:
+    print('This is an old regular expression. Cannot handle this.')
+    return None
+
+  prog = []
+  ops = RE_OPS
+  i = RE_HEADER_SIZE
+  end = i + (buf[4] | (buf[5] << 8))
+  while i < end:
+    op = ops[buf[i]]
+    if op is None:
+      print("ILLEGAL TYPE")
+      print("idx: %08x" % (i - RE_HEADER_SIZE))
+      print("typ: %02x" % buf[i])
+      break
+    i = op(prog, buf, i, i - RE_HEADER_SIZE)
+
+  return progToGraph(prog)
+
+def reToGraphStringIO(re):
+  """ the original byte at a time decoder, kept as reference for the
+      benchmark in benchmark.py """
+  f = StringIO(re)
+  version = struct.unpack('>I', f.read(4))
+  #print "version: %08x" % version[0]
+  if version[0] != 3:
+    print('This is an old regular expression. Cannot handle this.')
+    return None
+
+  # TODO: need to find the bug that sometimes regular expression decoding results in NULL
+  #hexdump(re)
+
+  g = RegexGraph()
+  mlen = struct.unpack('<H', f.read(2))
+  mlen = mlen[0]
+  idx = 0
+  while True:
+    idx = f.tell()-6
+    if mlen == idx:
+        break
+            
+    typ = ord(f.read(1))
+    if typ & 0xf == 10:
+        typ = 10
+    if typ == 0x2f:
+      target = struct.unpack('<H', f.read(2))
+      g.addEdge(idx, target[0])
+      g.addEdge(idx, idx+3)
+      g.setTag(idx, (typ, None))
+    elif typ == 0x0a:
+      target = struct.unpack('<H', f.read(2))
+      g.addEdge(idx, target[0])
+      #g.addEdge(idx, idx+3)
+      g.setTag(idx, (typ, None))
+    elif typ == 0x15:
+      # unsure overread
+      f.read(1)
+      g.setTag(idx, (typ, None))
+    elif typ == 0x19:
+      g.addEdge(idx, idx+1)
+      g.setTag(idx, (0x100, "^"))
+    elif typ == 0x29:
+      g.addEdge(idx, idx+1)
+      g.setTag(idx, (0x100, "$"))
+    elif typ == 0x02:
+      g.addEdge(idx, idx+2)
+      g.setTag(idx, (0x100, maybe_escape(chr(ord(f.read(1)) & 0xff))))
+    elif typ == 0x09:
+      g.addEdge(idx, idx+1)
+      g.setTag(idx, (0x100, "."))
+    elif (typ & 0xf) == 0xb:
+      cmask = CharMask()
+      
+      cnt = typ >> 4
+      for i in range(cnt):
+          c1 =  f.read(1)
+          c2 =  f.read(1)
+          cmask.addFromTo(c1, c2)
+
+      g.addEdge(idx, idx+1+cnt*2)
+      g.setTag(idx, (0x100, str(cmask)))
+    else:
+      print("ILLEGAL TYPE")
+      print("idx: %08x" % idx)
+      print("typ: %02x" % typ)
+      break
+  
+  return g
+
+def eliminateDummyEdges(g):
+    
+    for u, adjs in list(g.edges.items()):
+        
+        utag = g.getTag(u)
+        if utag == None:
+            continue
+        t,d = utag
+        if t == 0x2f:
+            # a jump can lead to another jump, look again after each one
+            found = True
+            while found:
+                found = False
+                for v in list(adjs):
+                    vtag = g.getTag(v)
+                    if vtag != None:
+                        t,d = vtag
+                        if t == 0x0a:
+                            edges = list(g.edges[v])
+                            for e in edges:
+                                g.addEdge(u, e)
+                            g.removeNode(v)
+                            found = True
+                            break
+
+
+def graphToRegEx(g):
+  # Merge adjacents and pattern match for RE ops
+  done = False
+  #g.pprint()
+  eliminateDummyEdges(g)
+  #g.pprint()
+  while not done:
+    done = True
+    if stats.enabled:
+      stats.count('regex_reduce_iterations')
+    for u, adjs in g.edges.items():
+      utag = g.getTag(u)
+      for v in adjs:
+        if g.mergeIfPossible(u, v):
+          done = False
+          break
+      if not done:
+        break
+
+  done = False
+  
+
+  while not done:
+    done = True
+    if stats.enabled:
+      stats.count('regex_reduce_iterations')
+    for u, adjs in g.edges.items():
+      utag = g.getTag(u)
+      
+      # Get rid of "ACCEPT" nodes
+      if utag is not None and utag[0] == 0x15:
+        g.removeNode(u)
+        done = False
+        break
+        
+      # Try to match *
+      if utag is not None and utag[0] in [0x2F] and len(adjs) == 2:
+        v_left = list(adjs)[0]
+        v_right = list(adjs)[1]
+        v_lefttag = g.getTag(v_left)
+        v_righttag = g.getTag(v_right)
+        
+
+        if v_lefttag is not None and v_lefttag[0] == 0x100:
+          if g.edges[v_left] == set([u]) and g.redges[v_left] == set([u]):       
+            g.removeEdge(u, v_left)
+            g.removeNode(v_left)
+            g.setTag(u, (0x100, '(' + v_lefttag[1] + ')*'))
+            done = False
+            break
+          elif u in g.edges[v_left] and len(g.redges[v_left]) == 2 and \
+               u in g.redges[v_left]:
+            entry = list(g.redges[v_left] - set([u]))[0]
+            g.removeEdge(entry, v_left)
+            g.removeEdge(u, v_left)
+            g.removeNode(v_left)
+            g.addEdge(entry, u)
+            g.setTag(u, (0x100, '(' + v_lefttag[1] + ')+'))
+            done = False
+            break
+          
+        if v_righttag is not None and v_righttag[0] == 0x100:
+          if g.edges[v_right] == set([u]) and g.redges[v_right] == set([u]):
+            g.removeEdge(u, v_right)
+            g.removeNode(v_right)
+            g.setTag(u, (0x100, '(' + v_righttag[1] + ')*'))
+            done = False
+            break
+          elif u in g.edges[v_right] and len(g.redges[v_right]) == 2 and \
+               u in g.redges[v_right]:
+            entry = list(g.redges[v_right] - set([u]))[0]
+            g.removeEdge(entry, v_right)
+            g.removeEdge(u, v_right)
+            g.removeNode(v_right)
+            g.addEdge(entry, u)
+            g.setTag(u, (0x100, '(' + v_righttag[1] + ')+'))
+            done = False
+            break
+
+      # Try to match | and ?
+      if utag is not None and utag[0] in [0x2F] and len(adjs) == 2:
+        v_left = list(adjs)[0]
+        v_right = list(adjs)[1]
+        v_lefttag = g.getTag(v_left)
+        v_righttag = g.getTag(v_right)
+
+        # Match |
+        if v_lefttag is not None and v_lefttag[0] == 0x100 and \
+           v_righttag is not None and v_righttag[0] == 0x100:
+          vl_next = g.edges[v_left]
+          vr_next = g.edges[v_right]
+
+          if len(vl_next) <= 1 and len(vr_next) <= 1 and \
+             vl_next == vr_next:
+            g.removeEdge(u, v_left)
+            g.removeEdge(u, v_right)
+            if len(vl_next) == 1:
+              join_node = list(vl_next)[0]
+              g.addEdge(u, join_node)
+            g.removeNode(v_left)
+            g.removeNode(v_right)
+            g.setTag(u, (0x100, '(' + v_lefttag[1] + '|' + v_righttag[1] + ')'))
+            done = False
+            break
+
+        # Match ?
+        if v_lefttag is not None and v_lefttag[0] == 0x100 and \
+           v_righttag is not None:
+          vl_next = g.edges[v_left]
+          if len(vl_next) == 1 and list(vl_next)[0] == v_right:
+            g.removeEdge(u, v_left)
+            g.removeEdge(u, v_right)
+            g.addEdge(u, v_right)
+            g.removeNode(v_left)
+            g.removeNode(v_right)
+            g.setTag(u, (0x100, '(' + v_lefttag[1] + ')?'))
+            done = False
+            break
+
+        if v_lefttag is not None and \
+           v_righttag is not None and v_righttag[0] == 0x100:
+          vr_next = g.edges[v_right]
+          if len(vr_next) == 1 and list(vr_next)[0] == v_left:
+            g.removeEdge(u, v_left)
+            g.removeEdge(u, v_right)
+            g.addEdge(u, v_left)
+            g.removeNode(v_left)
+            g.removeNode(v_right)
+            g.setTag(u, (0x100, '(' + v_righttag[1] + ')?'))
+            done = False
+            break
+
+      if utag is not None and utag[0] == 0x31:
+        for v in g.edges[u]:
+          for uu in g.redges[u]:
+            g.addEdge(uu, v)
+        g.removeNode(u)
+        done = False
+        break
+
+      # Merge constants if possible
+      for v in adjs:
+        if g.mergeIfPossible(u, v):
+          done = False
+          break
+      if not done:
+        break
+
+  #g.pprint()
+  if len(g.nodes) == 1:
+    return g.getTag(list(g.nodes)[0])[1]
+  else:
+    return None
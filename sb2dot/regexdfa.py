@@ -0,0 +1,530 @@
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: regexdfa.py
+# task: automata for regular expression bytecode
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# The bytecode decoded by redis.reToGraph() is turned into an NFA over
+# bytes and from there into a DFA by subset construction. Matching is a
+# search: without ^ the expression may start anywhere, and once the accept
+# instruction is reached the input matches no matter what follows.
+#
+
+import hashlib
+import struct
+import threading
+import compat
+import redis
+import stats
+
+NFA_SPLIT = 0
+NFA_JUMP = 1
+NFA_ACCEPT = 2
+NFA_BOL = 3
+NFA_EOL = 4
+NFA_CONSUME = 5
+
+FULL_MASK = redis.FULL_MASK
+
+# DFA state of an input that already matched
+ACCEPTED = frozenset([-1])
+
+# DFA state of an input that can not match anymore
+DEAD = frozenset()
+
+# give up on expressions whose DFA gets larger than this
+MAX_DFA_STATES = 4096
+
+class NFA(object):
+  """ nodes maps a bytecode offset to (kind, byte mask, successors) """
+  def __init__(self, nodes):
+    self.nodes = nodes
+    self.masks = sorted(set([mask for kind, mask, succ in nodes.values()
+                             if kind == NFA_CONSUME]))
+    self.accepts = frozenset([u for u, (kind, mask, succ) in nodes.items()
+                              if kind == NFA_ACCEPT])
+    self.restart = self.closure([0], False, False)
+    self.anchored = len(self.restart) == 0
+
+  def closure(self, start, bol, eol):
+    """ nodes reachable from start without consuming input, as far as the
+        ^ and $ assertions allow. Keeps consuming nodes, accept and the
+        $ nodes that might still pass at the end of the input. """
+    nodes = self.nodes
+    seen = set()
+    result = set()
+    stack = list(start)
+    while stack:
+      u = stack.pop()
+      if u in seen or u not in nodes:
+        continue
+      seen.add(u)
+      kind, mask, succ = nodes[u]
+      if kind == NFA_SPLIT or kind == NFA_JUMP:
+        stack.extend(succ)
+      elif kind == NFA_BOL:
+        if bol:
+          stack.extend(succ)
+      elif kind == NFA_EOL:
+        if eol:
+          stack.extend(succ)
+        else:
+          result.add(u)
+      else:
+        result.add(u)
+    return result
+
+  def state(self, nodes):
+    if not nodes:
+      return DEAD
+    if not self.accepts.isdisjoint(nodes):
+      return ACCEPTED
+    return frozenset(nodes)
+
+  def start(self):
+    return self.state(self.closure([0], True, False))
+
+  def step(self, s, c):
+    if s is ACCEPTED:
+      return ACCEPTED
+    bit = 1 << c
+    nodes = self.nodes
+    targets = []
+    for u in s:
+      kind, mask, succ = nodes[u]
+      if kind == NFA_CONSUME and mask & bit:
+        targets.extend(succ)
+    result = self.closure(targets, False, False)
+    result.update(self.restart)
+    return self.state(result)
+
+  def accepts_at_end(self, s, at_start=False):
+    if s is ACCEPTED:
+      return True
+    nodes = self.nodes
+    targets = []
+    for u in s:
+      kind, mask, succ = nodes[u]
+      if kind == NFA_EOL:
+        targets.extend(succ)
+    for u in self.closure(targets, at_start, True):
+      if nodes[u][0] == NFA_ACCEPT:
+        return True
+    return False
+
+  def byte_classes(self):
+    """ bytes no character class can tell apart, as lists of (first, last)
+        byte ranges ordered by their first byte """
+    # the classes only change where one of the masks does
+    edges = set([0])
+    for mask in self.masks:
+      change = (mask ^ (mask << 1)) & FULL_MASK
+      while change:
+        low = change & -change
+        edges.add(low.bit_length() - 1)
+        change ^= low
+    edges = sorted(edges)
+    classes = {}
+    for n, first in enumerate(edges):
+      last = n + 1 < len(edges) and edges[n + 1] - 1 or 255
+      key = tuple([(mask >> first) & 1 for mask in self.masks])
+      classes.setdefault(key, []).append((first, last))
+    return sorted(classes.values())
+
+def compile_nfa(raw):
+  """ NFA for the regex bytecode raw (version header included) or None if
+      the bytecode can not be handled """
+  buf = bytearray(raw)
+  try:
+    if struct.unpack_from('>I', buf)[0] != 3:
+      return None
+    end = redis.RE_HEADER_SIZE + (buf[4] | (buf[5] << 8))
+    nodes = {}
+    i = redis.RE_HEADER_SIZE
+    while i < end:
+      idx = i - redis.RE_HEADER_SIZE
+      op = buf[i]
+      if op == 0x2f:
+        nodes[idx] = (NFA_SPLIT, 0, (buf[i+1] | (buf[i+2] << 8), idx + 3))
+        i += 3
+      elif op & 0xf == 0xa:
+        # the high nibble of a jump is not used, see redis.RE_OPS
+        nodes[idx] = (NFA_JUMP, 0, (buf[i+1] | (buf[i+2] << 8),))
+        i += 3
+      elif op == 0x15:
+        nodes[idx] = (NFA_ACCEPT, 0, ())
+        i += 2
+      elif op == 0x19:
+        nodes[idx] = (NFA_BOL, 0, (idx + 1,))
+        i += 1
+      elif op == 0x29:
+        nodes[idx] = (NFA_EOL, 0, (idx + 1,))
+        i += 1
+      elif op == 0x02:
+        nodes[idx] = (NFA_CONSUME, 1 << buf[i+1], (idx + 2,))
+        i += 2
+      elif op == 0x09:
+        nodes[idx] = (NFA_CONSUME, FULL_MASK, (idx + 1,))
+        i += 1
+      elif op & 0xf == 0xb:
+        cmask = redis.CharMask()
+        cnt = op >> 4
+        for j in range(i + 1, i + 1 + cnt*2, 2):
+          cmask.addRange(buf[j], buf[j+1])
+        nodes[idx] = (NFA_CONSUME, cmask.mask, (idx + 1 + cnt*2,))
+        i += 1 + cnt*2
+      else:
+        return None
+  except (IndexError, struct.error):
+    return None
+  if 0 not in nodes:
+    return None
+  return NFA(nodes)
+
+def build_dfa(nfa, max_states=MAX_DFA_STATES):
+  """ complete DFA over the byte classes of nfa by subset construction.
+      Returns (classes, transitions, accepting) with state 0 as start, or
+      None if it would get larger than max_states. """
+  classes = nfa.byte_classes()
+  # node sets are int bit sets here, -1 stands for ACCEPTED
+  offsets = sorted(nfa.nodes)
+  node_bit = dict([(u, 1 << i) for i, u in enumerate(offsets)])
+  def bits(nodes):
+    if nodes is ACCEPTED:
+      return -1
+    x = 0
+    for u in nodes:
+      x |= node_bit[u]
+    return x
+  def node_set(x):
+    if x == -1:
+      return ACCEPTED
+    return [u for u in offsets if x & node_bit[u]]
+  accepts = bits(nfa.accepts)
+  restart = bits(nfa.restart)
+  # only sets with a $ can accept at the end of the input
+  eols = bits([u for u, (kind, mask, succ) in nfa.nodes.items() if kind == NFA_EOL])
+  # a step is a union of precomputed closures: for every consuming node
+  # the closure of its successors by class, 0 for the classes it does not
+  # match. The row of a state is the or of the rows of its nodes.
+  moves = {}
+  for u, (kind, mask, succ) in nfa.nodes.items():
+    if kind == NFA_CONSUME:
+      closure = bits(nfa.closure(succ, False, False))
+      moves[node_bit[u]] = [(mask >> cls[0][0]) & 1 and closure or 0 for cls in classes]
+  # the target of the classes no node of a state matches
+  idle = restart & accepts and -1 or restart
+
+  # the start state is never looked up in ids: ^ only passes there, so an
+  # equal set reached later may still differ at the end of the input
+  ids = {}
+  states = [bits(nfa.start())]
+  trans = []
+  accepting = []
+  i = 0
+  while i < len(states):
+    x = states[i]
+    targets = None
+    if x == -1:
+      targets = [-1] * len(classes)
+    else:
+      y = x
+      while y:
+        low = y & -y
+        y ^= low
+        move = moves.get(low)
+        if move is not None:
+          if targets is None:
+            targets = [restart | t for t in move]
+          else:
+            targets = [t | m for t, m in zip(targets, move)]
+      if targets is None:
+        targets = [idle] * len(classes)
+    row = []
+    for t in targets:
+      if t & accepts:
+        t = -1
+      n = ids.get(t)
+      if n is None:
+        n = ids[t] = len(states)
+        states.append(t)
+      row.append(n)
+    if len(states) > max_states:
+      return None
+    trans.append(row)
+    accepting.append(x == -1 or ((x & eols) != 0 and
+                                 nfa.accepts_at_end(node_set(x), i == 0)))
+    i += 1
+  return classes, trans, accepting
+
+def minimize(trans, accepting):
+  """ Hopcroft partition refinement, returns the block of every state """
+  # the states leading to every state, by class
+  inverse = [[[] for s in trans] for n in trans[0]]
+  for s, row in enumerate(trans):
+    for n, t in enumerate(row):
+      inverse[n][t].append(s)
+
+  blocks = []
+  block = [0] * len(trans)
+  for members in ([s for s in range(len(trans)) if accepting[s]],
+                  [s for s in range(len(trans)) if not accepting[s]]):
+    if members:
+      for s in members:
+        block[s] = len(blocks)
+      blocks.append(set(members))
+  # refining by one of two blocks also refines by the other
+  work = set([min(range(len(blocks)), key=lambda b: len(blocks[b]))])
+  if len(blocks) < 2:
+    work = set()
+
+  while work:
+    splitter = list(blocks[work.pop()])
+    for inv in inverse:
+      touched = {}
+      for t in splitter:
+        for s in inv[t]:
+          b = block[s]
+          if b in touched:
+            touched[b].append(s)
+          else:
+            touched[b] = [s]
+      for b, inside in touched.items():
+        if len(inside) == len(blocks[b]):
+          continue
+        # split b into the states that reach the splitter and the others
+        new = len(blocks)
+        inside = set(inside)
+        blocks[b] -= inside
+        blocks.append(inside)
+        for s in inside:
+          block[s] = new
+        if b in work or len(inside) <= len(blocks[b]):
+          work.add(new)
+        else:
+          work.add(b)
+  return block
+
+def canonical_form(classes, trans, accepting):
+  """ minimal DFA with states numbered in breadth first order from the
+      start, transitions as (first byte, last byte, target) ranges. Equal
+      forms mean equal languages. """
+  block = minimize(trans, accepting)
+  runs = sorted([(first, last, n) for n, cls in enumerate(classes)
+                 for first, last in cls])
+
+  # one DFA state per block is enough to read the transitions
+  rep = {}
+  for s in range(len(trans)):
+    rep.setdefault(block[s], s)
+
+  number = {block[0]: 0}
+  order = [block[0]]
+  form = []
+  i = 0
+  while i < len(order):
+    s = rep[order[i]]
+    ranges = []
+    for first, last, n in runs:
+      b = block[trans[s][n]]
+      if b not in number:
+        number[b] = len(order)
+        order.append(b)
+      t = number[b]
+      if ranges and ranges[-1][2] == t:
+        ranges[-1][1] = last
+      else:
+        ranges.append([first, last, t])
+    form.append((accepting[s], tuple([tuple(r) for r in ranges])))
+    i += 1
+  return tuple(form)
+
+def language_key(raw):
+  """ digest of the canonical minimal DFA of the regex bytecode raw, None
+      if the bytecode is not understood or the DFA gets too large """
+  nfa = compile_nfa(raw)
+  if nfa is None:
+    return None
+  dfa = build_dfa(nfa)
+  if dfa is None:
+    return None
+  return hashlib.sha1(compat.binary(repr(canonical_form(*dfa)))).hexdigest()
+
+class RegexAliases(object):
+  """ --dedup-regex for the regexes that are looked up: get(idx, default)
+      returns the first looked up regex accepting the same language as
+      regex idx, default if that is idx itself. bytecode(idx) reads the
+      bytecode of regex idx, equal bytecode is grouped before an automaton
+      is built. """
+  def __init__(self, bytecode):
+    self.bytecode = bytecode
+    self.alias = {}
+    self.by_bytecode = {}
+    self.by_language = {}
+
+  def get(self, idx, default=None):
+    first = self.alias.get(idx)
+    if first is None:
+      raw = self.bytecode(idx)
+      first = self.by_bytecode.get(raw)
+      if first is None:
+        with stats.phase('regex_dedup'):
+          key = language_key(raw)
+        if stats.enabled:
+          stats.count('regex_languages')
+        first = idx
+        if key is not None:
+          first = self.by_language.setdefault(key, idx)
+        self.by_bytecode[raw] = first
+      self.alias[idx] = first
+    if first == idx:
+      return default
+    return first
+
+  def duplicates(self):
+    """ looked up regex -> first one of the same language, for the ones
+        that are not the first """
+    return dict([(idx, first) for idx, first in self.alias.items() if idx != first])
+
+  def __len__(self):
+    return len(self.alias)
+
+  def clear(self):
+    self.alias.clear()
+    self.by_bytecode.clear()
+    self.by_language.clear()
+
+class LazyDFA(object):
+  """ DFA built while matching. Every state has a row of 256 transitions,
+      -1 where the target was not computed yet. The tables are dropped
+      when more than max_states states were built. Subclasses define the
+      states by start_state(), step(), result() and done(). """
+  def __init__(self, max_states=MAX_DFA_STATES):
+    self.max_states = max_states
+    self.lock = threading.Lock()
+    self.start = self.start_state()
+    self.flush()
+
+  def flush(self):
+    # (states, rows, result at the end of the input, result known), replaced
+    # as a whole so a concurrent run() keeps using consistent tables. The
+    # start state is never looked up in ids, see build_dfa().
+    self.ids = {}
+    self.tables = ([self.start], [[-1] * 256],
+                   [self.result(self.start, True)], [self.done(self.start)])
+
+  def state_id(self, s):
+    n = self.ids.get(s)
+    if n is None:
+      states, rows, results, done = self.tables
+      n = self.ids[s] = len(states)
+      states.append(s)
+      rows.append([-1] * 256)
+      results.append(self.result(s, False))
+      done.append(self.done(s))
+      if stats.enabled:
+        stats.count('regex_dfa_states')
+    return n
+
+  def transition(self, tables, n, c):
+    """ target of state n of tables on c, returns the tables it is in """
+    s = self.step(tables[0][n], c)
+    with self.lock:
+      if tables is not self.tables or len(tables[0]) >= self.max_states:
+        # flushed by another thread or full
+        if tables is self.tables:
+          self.flush()
+        return self.tables, self.state_id(s)
+      t = tables[1][n][c] = self.state_id(s)
+      return tables, t
+
+  def run(self, data):
+    """ result of the state reached by the byte string data, stops early
+        once the result can not change anymore """
+    tables = self.tables
+    rows, done = tables[1], tables[3]
+    n = 0
+    for c in bytearray(data):
+      t = rows[n][c]
+      if t < 0:
+        tables, t = self.transition(tables, n, c)
+        rows, done = tables[1], tables[3]
+      n = t
+      if done[n]:
+        break
+    return tables[2][n]
+
+class Matcher(LazyDFA):
+  """ lazy DFA of one regex """
+  def __init__(self, nfa, max_states=MAX_DFA_STATES):
+    self.nfa = nfa
+    LazyDFA.__init__(self, max_states)
+
+  def start_state(self):
+    return self.nfa.start()
+
+  def step(self, s, c):
+    return self.nfa.step(s, c)
+
+  def result(self, s, at_start):
+    return self.nfa.accepts_at_end(s, at_start)
+
+  def done(self, s):
+    return s is ACCEPTED or s is DEAD
+
+  def match(self, data):
+    """ True if the regex matches the byte string data """
+    return self.run(data)
+
+class MultiMatcher(LazyDFA):
+  """ lazy product DFA of several regexes, a state has one NFA state set
+      per regex. run() returns the indices of the matching regexes. """
+  def __init__(self, nfas, max_states=MAX_DFA_STATES):
+    self.nfas = nfas
+    LazyDFA.__init__(self, max_states)
+
+  def start_state(self):
+    return tuple([nfa.start() for nfa in self.nfas])
+
+  def step(self, s, c):
+    return tuple([nfa.step(t, c) for nfa, t in zip(self.nfas, s)])
+
+  def result(self, s, at_start):
+    return frozenset([i for i, nfa in enumerate(self.nfas)
+                      if nfa.accepts_at_end(s[i], at_start)])
+
+  def done(self, s):
+    for t in s:
+      if t is not ACCEPTED and t is not DEAD:
+        return False
+    return True
+
+# matchers by bytecode, equal regexes in different profiles share one
+matchers = {}
+matchers_lock = threading.Lock()
+
+def get_matcher(raw):
+  """ cached Matcher for the regex bytecode raw, None if it can not be
+      compiled """
+  with matchers_lock:
+    if raw in matchers:
+      return matchers[raw]
+    nfa = compile_nfa(raw)
+    m = matchers[raw] = nfa and Matcher(nfa)
+    return m
@@ -1,174 +1,880 @@
-#!/usr/bin/env python
-
-#
-# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
-# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
-#    uses and extends code from Dionysus Blazakis with his permission
-#
-# This program is free software; you can redistribute it and/or modify
-# it under the terms of the GNU General Public License as published by
-# the Free Software Foundation; either version 2 of the License, or
-# (at your option) any later version.
-#
-# This program is distributed in the hope that it will be useful,
-# but WITHOUT ANY WARRANTY; without even the implied warranty of
-# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
-# GNU General Public License for more details.
-#
-# You should have received a copy of the GNU General Public License along
-# with this program; if not, write to the Free Software Foundation, Inc.,
-# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
-#
-
-from __future__ import with_statement
-import struct
-import sys
-import binascii
-import pprint
-import os
-import redis
-from minigraph import *
-from filters import *
-from outputdot import *
-
-def load_op_names(fn):
-  global OP_TABLE_COUNT
-  f = open(fn, 'r')
-  ops = [s.strip() for s in f.readlines()]
-  if ops[-1] == '':
-    ops = ops[:-1]
-  OP_TABLE_COUNT = len(ops)
-  return ops
-
-def parse_filternode(g, f, offset, re_table):
-  if g.getTag(offset * 8) is not None:
-    return
-
-  f.seek(offset * 8)
-  is_terminal = ord(f.read(1)) == 1
-
-  if is_terminal:
-    f.read(1) # padding
-    result, = struct.unpack('<H', f.read(2))
-    tag = Terminal(result)
-    g.setTag(offset * 8, tag)
-  else:
-    filter, filter_arg, match, unmatch = struct.unpack('<BHHH', f.read(7))
-    #print "rule: %d %d %d %d" % (filter, filter_arg, match, unmatch)
-    tag = get_filter(f, re_table, filter, filter_arg)
-    #print tag
-    g.setTag(offset * 8, tag)
-    g.addEdge(offset * 8, match * 8)
-    g.addEdge(offset * 8, unmatch * 8)
-
-    if g.getTag(match * 8) is None:
-      parse_filternode(g, f, match, re_table)
-    if g.getTag(unmatch * 8) is None:
-      parse_filternode(g, f, unmatch, re_table)
-
-
-
-def parse_optable(profile_name, f, op_table):
-  global regex_table
-  global sbops
-  
-  non_default_ops = []
-  non_default_offs = {}
-  names = {}
-  clean_names = {}
-  cnt = 0
-  default_op = op_table[0]
-  for op_idx, op_offset in enumerate(op_table):
-    if op_offset != default_op:      
-      if names.has_key(op_offset):
-          names[op_offset] = names[op_offset] + " " + sbops[cnt]
-          clean_names[op_offset] = clean_names[op_offset] + "\n" + sbops[cnt]
-      else:
-          names[op_offset] = sbops[cnt]
-          clean_names[op_offset] = sbops[cnt]
-      if not non_default_offs.has_key(op_offset):
-          non_default_ops.append((cnt,op_idx))
-      non_default_offs[op_offset] = 1
-      
-    cnt = cnt + 1
-    
-  cnt = 0
-  g = MiniGraph()
-  for op_idx, op_offset in enumerate(op_table):
-    #print "%u: %u" % (op_idx, op_offset)
-    parse_filternode(g, f, op_offset, regex_table)
-    cnt = cnt + 1
-
-  dump_to_dot(g, default_op, "default", "default", profile_name)
-  for i, op_idx in non_default_ops:
-    
-    dump_to_dot(g, op_table[op_idx], names[op_table[op_idx]], clean_names[op_table[op_idx]], profile_name)
-  
-
-def usage():
-  print 'usage:'
-  print '    sb2dot sbops.txt sbprofile.bin'
-  print
-  print '    This will turn a binary sandbox profile into a nice .dot graph.'
-  sys.exit(-1)
-
-if len(sys.argv) < 3:
-  usage()
-
-sbops = load_op_names(sys.argv[1])
-sbprofile_path = sys.argv[2]
-
-with open(sbprofile_path, 'rb') as f:
-    
-  # read in short header
-  flags, re_table_offset, re_table_count = struct.unpack('<HHH', f.read(6))
-
-  # read in the regex table
-  f.seek(re_table_offset * 8)
-  re_table = struct.unpack('<%dH' % re_table_count, f.read(2 * re_table_count))
-
-  print "[+] loading and decoding regular expressions"
-  regex_table = []
-  for offset in re_table:
-    #print "position %08x" % (offset *8)
-    f.seek(offset * 8)
-    re_count = struct.unpack('<I', f.read(4))[0]
-    #print "len: %08x" % (re_count)
-    raw = f.read(re_count)
-    g = redis.reToGraph(raw)
-    re = redis.graphToRegEx(g)
-    if re == None:
-        print "[!] ERROR: regex disassembler failed disassembling a regular expression - TODO"
-    #die()
-    regex_table.append(re)
-
-  # now read the profile(s)
-  if flags == 0x8000:
-    # this is a profile collection
-    print '[+] found: profile collection'
-
-    f.seek(3*2)
-    collection_count, = struct.unpack('<H', f.read(2))
-    print '[i] collection count %u' % collection_count
-    
-    for ic in range(collection_count):
-      # read each operation in
-      f.seek(4 * 2 + ic * (2 * (2 + OP_TABLE_COUNT)))
-      profilename_offset, innerflags = struct.unpack('<HH', f.read(4))
-      op_table = struct.unpack('<%dH' % OP_TABLE_COUNT, f.read(2 * OP_TABLE_COUNT))
-      
-      f.seek(profilename_offset * 8)
-      count, = struct.unpack('<I', f.read(4))
-      profile_name = f.read(count).strip('\x00')
-      print "[+] decoding profile: " + profile_name
-      parse_optable(profile_name,f, op_table)
-      
-  else: # flags are usually 0 (sometimes 1,2)
-    # this is a single profile
-    print '[+] found: single profile'
-    print '[+] decoding profile'
-
-    f.seek(3*2)
-    op_table = struct.unpack('<%dH' % OP_TABLE_COUNT, f.read(2 * OP_TABLE_COUNT))
-    profile_name = sbprofile_path
-    parse_optable(profile_name,f, op_table)
+#!/usr/bin/env python
+
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+from __future__ import with_statement
+from __future__ import print_function
+import struct
+import sys
+import binascii
+import pprint
+import os
+import getopt
+import fnmatch
+import compat
+import redis
+import stats
+import graphstats
+import cache
+import manifest
+import snapshot
+import archive
+import daemon
+import macho
+import slicing
+import summary
+import sbpl
+import regexdfa
+import matrix
+import jsonl
+import outputdot
+from minigraph import *
+import filters
+from filters import *
+from outputdot import *
+
+def load_op_names(fn):
+  global OP_TABLE_COUNT
+  if macho.is_macho(fn):
+    # the Sandbox kext or a kernelcache instead of an sbops.txt file
+    try:
+      ops, cached = macho.cached_operation_names(fn, sbops_cache_dir)
+    except (macho.MachOError, struct.error) as e:
+      print('[!] cannot extract operation names: ' + str(e))
+      sys.exit(-1)
+    if cached:
+      print('[+] loaded %u cached operation names for %s' % (len(ops), fn))
+    else:
+      print('[+] extracted %u operation names from %s' % (len(ops), fn))
+    OP_TABLE_COUNT = len(ops)
+    return ops
+  f = compat.open_text(fn)
+  ops = [s.strip() for s in f.readlines()]
+  if ops[-1] == '':
+    ops = ops[:-1]
+  OP_TABLE_COUNT = len(ops)
+  return ops
+
+def read_regex(f, offset):
+  #print "position %08x" % (offset *8)
+  f.seek(offset * 8)
+  re_count = struct.unpack('<I', f.read(4))[0]
+  #print "len: %08x" % (re_count)
+  return f.read(re_count)
+
+def load_regex(f, offset):
+  """ returns the decompiled regex (None on failure) and its bytecode """
+  raw = read_regex(f, offset)
+  g = redis.reToGraph(raw)
+  re = redis.graphToRegEx(g)
+  if re == None:
+      print("[!] ERROR: regex disassembler failed disassembling a regular expression - TODO")
+      if stats.enabled:
+        stats.count('regex_failed')
+  #die()
+  if stats.enabled:
+    stats.count('regex_decoded')
+  return re, raw
+
+def dedup_regexes(f, re_table):
+  """ groups the regular expressions that accept the same language as the
+      profiles reach them, only the first one of every group gets
+      decompiled and rendered """
+  print("[+] grouping equivalent regular expressions")
+  filters.regex_alias = regexdfa.RegexAliases(lambda idx: read_regex(f, re_table[idx]))
+
+def report_dedup():
+  aliases = filters.regex_alias
+  duplicates = aliases.duplicates()
+  for idx in sorted(duplicates):
+    print('[i] regex %u accepts the same language as regex %u' % (idx, duplicates[idx]))
+  print('[i] %u of %u used regular expressions are duplicates' % (len(duplicates), len(aliases)))
+  if stats.enabled:
+    stats.count('regex_classes', len(aliases) - len(duplicates))
+    stats.count('regex_duplicates', len(duplicates))
+
+class LazyRegexTable(object):
+  """ decodes regular expressions on first use, so only the ones reached by
+      the decoded profiles are decompiled. The cache is either a cache.Pool
+      or a cache.LRUCache (streaming mode). With decompile False only the
+      bytecode is read and the regex is None, the stats formats tell
+      regexes apart by their bytecode. """
+  def __init__(self, f, offsets, cache, decompile=True):
+    self.f = f
+    self.offsets = offsets
+    self.cache = cache
+    self.decompile = decompile
+    self.written = set()
+
+  def __len__(self):
+    return len(self.offsets)
+
+  def entry(self, idx):
+    entry = self.cache.get(idx)
+    if entry is None:
+      with stats.phase('regex'):
+        if self.decompile:
+          entry = load_regex(self.f, self.offsets[idx])
+        else:
+          entry = (None, read_regex(self.f, self.offsets[idx]))
+      self.cache.put(idx, entry)
+      if jsonl_writer is not None and idx not in self.written:
+        # with --stream a regex can be decoded again after it was evicted
+        self.written.add(idx)
+        jsonl_writer.regex(idx, self.offsets[idx], entry[0], entry[1])
+    return entry
+
+  def __getitem__(self, idx):
+    return self.entry(idx)[0]
+
+  def bytecode(self, idx):
+    """ the bytecode is kept in the filter tags for matching (regexdfa.py) """
+    return self.entry(idx)[1]
+
+def read_filternode(f, offset, re_table):
+  f.seek(offset * 8)
+  is_terminal = ord(f.read(1)) == 1
+
+  if is_terminal:
+    f.read(1) # padding
+    result, = struct.unpack('<H', f.read(2))
+    return (get_terminal(result), None, None, None, result)
+
+  filter, filter_arg, match, unmatch = struct.unpack('<BHHH', f.read(7))
+  #print "rule: %d %d %d %d" % (filter, filter_arg, match, unmatch)
+  if stats.enabled:
+    with stats.phase('filters'):
+      tag = get_filter(f, re_table, filter, filter_arg)
+  else:
+    tag = get_filter(f, re_table, filter, filter_arg)
+  #print tag
+  return (tag, match, unmatch, filter, filter_arg)
+
+def load_filternode(f, offset, re_table, node_cache=None):
+  node = None
+  if node_cache is not None:
+    node = node_cache.get(offset)
+  if node is None:
+    if stats.enabled:
+      stats.count('nodes_decoded')
+    node = read_filternode(f, offset, re_table)
+    if node_cache is not None:
+      node_cache.put(offset, node)
+  return node
+
+def parse_filternode(g, f, offset, re_table, node_cache=None):
+  if g.getTag(offset * 8) is not None:
+    if stats.enabled:
+      stats.count('node_cache_hits')
+    return
+
+  node = load_filternode(f, offset, re_table, node_cache)
+  tag, match, unmatch, filter, filter_arg = node
+  g.setTag(offset * 8, tag)
+  if match is not None:
+    g.addEdge(offset * 8, match * 8)
+    g.addEdge(offset * 8, unmatch * 8)
+    g.setBranches(offset * 8, match * 8, unmatch * 8)
+
+    parse_filternode(g, f, match, re_table, node_cache)
+    parse_filternode(g, f, unmatch, re_table, node_cache)
+  else:
+    g.addNode(offset * 8)
+
+
+def read_profile_index(f):
+  """ returns (profile name, op table) for every entry of a collection """
+  f.seek(3*2)
+  collection_count, = struct.unpack('<H', f.read(2))
+
+  index = []
+  for ic in range(collection_count):
+    # read each operation in
+    f.seek(4 * 2 + ic * (2 * (2 + OP_TABLE_COUNT)))
+    profilename_offset, innerflags = struct.unpack('<HH', f.read(4))
+    op_table = struct.unpack('<%dH' % OP_TABLE_COUNT, f.read(2 * OP_TABLE_COUNT))
+
+    f.seek(profilename_offset * 8)
+    count, = struct.unpack('<I', f.read(4))
+    profile_name = compat.text(f.read(count)).strip('\x00')
+    index.append((profile_name, op_table))
+  return index
+
+def group_optable(op_table):
+  """ groups operations sharing a decision graph, returns a list of
+      (offset, name, clean name, op indices) with the default group first """
+  default_op = op_table[0]
+  groups = [(default_op, "default", "default", [])]
+  by_offset = {}
+  for op_idx, op_offset in enumerate(op_table):
+    if op_offset == default_op:
+      groups[0][3].append(op_idx)
+    elif op_offset in by_offset:
+      offset, name, clean_name, ops = by_offset[op_offset]
+      ops.append(op_idx)
+      by_offset[op_offset] = (offset, name + " " + sbops[op_idx], clean_name + "\n" + sbops[op_idx], ops)
+    else:
+      by_offset[op_offset] = (op_offset, sbops[op_idx], sbops[op_idx], [op_idx])
+      groups.append(op_offset)
+
+  for i in range(1, len(groups)):
+    groups[i] = by_offset[groups[i]]
+  return groups
+
+def select_ops(patterns):
+  """ returns the indices of all operations matching one of the patterns,
+      an exact name wins over glob matching (many names contain a '*') """
+  selected = set()
+  for pattern in patterns:
+    if pattern in sbops:
+      selected.add(sbops.index(pattern))
+      continue
+    matched = [i for i, op in enumerate(sbops) if fnmatch.fnmatchcase(op, pattern)]
+    if len(matched) == 0:
+      print('[!] no operation matches: ' + pattern)
+    selected.update(matched)
+  return selected
+
+def slice_groups(g, groups):
+  """ slices g to the selected filter types and moves every group to the
+      root of its sliced graph """
+  roots = [op_offset * 8 for op_offset, name, clean_name, ops in groups]
+  sg, sliced_roots = slicing.slice_graph(g, roots, slice_classes)
+  if stats.enabled:
+    stats.count('slice_nodes_in', len(g.nodes))
+    stats.count('slice_nodes_out', len(sg.nodes))
+  return sg, [(sliced_roots[op_offset * 8] // 8, name, clean_name, ops)
+              for op_offset, name, clean_name, ops in groups]
+
+def summarize_groups(g, groups):
+  with stats.phase('summary'):
+    return summary.reachable_terminals(g, [op_offset * 8 for op_offset, name, clean_name, ops in groups])
+
+def print_unconditional(profile_name, g, groups):
+  """ lists the operations that always end in the same terminal """
+  summaries = summarize_groups(g, groups)
+  for op_offset, name, clean_name, ops in groups:
+    terms = summaries[op_offset * 8]
+    if summary.is_unconditional(terms):
+      for op_idx in ops:
+        print("%s\t%s\t%s" % (profile_name, sbops[op_idx], summary.summary_label(terms)))
+
+def write_sbpl(profile_name, g, groups):
+  summaries = summarize_groups(g, groups)
+  rules = []
+  for op_offset, name, clean_name, ops in groups:
+    if name == "default":
+      op_names = ["default"]
+    else:
+      op_names = [sbops[op_idx] for op_idx in ops]
+    rules.append((op_offset * 8, op_names))
+
+  filename = sbpl.sbpl_filename(profile_name)
+  print("[+]    generating " + filename)
+  with stats.phase('sbpl'):
+    text = sbpl.decompile(profile_name, g, summaries, rules)
+  with compat.open_text(filename, 'w') as out:
+    out.write(text)
+
+def write_jsonl(profile_name, f, groups, nodes):
+  """ writes the operations and the nodes below them without building a
+      graph, every node only once per profile """
+  seen = set()
+  for op_offset, name, clean_name, ops in groups:
+    for op_idx in ops:
+      if selected_ops is None or op_idx in selected_ops:
+        jsonl_writer.operation(profile_name, sbops[op_idx], op_idx, op_offset)
+    stack = [op_offset]
+    with stats.phase('nodes'):
+      while stack:
+        offset = stack.pop()
+        if offset in seen:
+          continue
+        seen.add(offset)
+        node = load_filternode(f, offset, regex_table, nodes)
+        jsonl_writer.node(profile_name, offset, node)
+        if node[1] is not None:
+          # match first, like parse_filternode()
+          stack.append(node[2])
+          stack.append(node[1])
+    jsonl_writer.flush()
+
+def parse_optable(profile_name, f, op_table, nodes=None, hashes=None):
+  global regex_table
+  global sbops
+
+  groups = group_optable(op_table)
+  if selected_ops is not None:
+    groups = [group for group in groups if selected_ops.intersection(group[3])]
+
+  if run_manifest is not None:
+    # only regenerate the graphs whose content hash changed
+    hasher = subgraph_hasher
+    if hashes is not None:
+      # the snapshot has the digest of every node, nothing is read again
+      hasher = manifest.SubgraphHasher(f, regex_table.offsets, hashes)
+    changed = []
+    for group in groups:
+      op_offset, name = group[0], group[1]
+      output = dot_filename(name, profile_name)
+      digest = hasher.hexdigest(op_offset, name + "\0" + profile_name)
+      if not run_manifest.is_current(output, digest):
+        changed.append(group)
+      run_manifest.record(output, digest)
+    groups = changed
+
+  if jsonl_writer is not None:
+    write_jsonl(profile_name, f, groups, streaming and node_cache or nodes)
+    return
+
+  if streaming:
+    stream_optable(profile_name, f, groups)
+    return
+
+  g = MiniGraph()
+  with stats.phase('nodes'):
+    for op_offset, name, clean_name, ops in groups:
+      parse_filternode(g, f, op_offset, regex_table, nodes)
+
+  if slice_classes is not None:
+    with stats.phase('slice'):
+      g, groups = slice_groups(g, groups)
+
+  if unconditional_only:
+    print_unconditional(profile_name, g, groups)
+    return
+  if output_format == 'sbpl':
+    write_sbpl(profile_name, g, groups)
+    return
+  if matrix_writer is not None:
+    matrix_writer.add(profile_name, matrix.matrix_rows(g, groups, sbops, selected_ops))
+    return
+  if show_summaries:
+    outputdot.node_summaries = summarize_groups(g, groups)
+
+  if stats_writer is not None:
+    op_groups = [(name, op_offset) for op_offset, name, clean_name, ops in groups]
+    with stats.phase('graphstats'):
+      stats_writer.add(graphstats.profile_stats(g, profile_name, op_groups))
+    return
+
+  with stats.phase('dot'):
+    for op_offset, name, clean_name, ops in groups:
+      dump_to_dot(g, op_offset, name, clean_name, profile_name)
+
+
+def decode_profile(profile_name, f, op_table):
+  # nodes come from the snapshot if there is a valid one, otherwise they
+  # are recorded for the snapshot written at the end of the run
+  nodes = None
+  hashes = None
+  if snapshot_profiles is not None and profile_name in snapshot_profiles:
+    nodes = snapshot_profiles[profile_name].nodes
+    hashes = snapshot_profiles[profile_name].hashes
+  elif snapshot_writer is not None:
+    nodes = cache.Pool()
+
+  if jsonl_writer is not None:
+    jsonl_writer.profile(profile_name)
+  parse_optable(profile_name, f, op_table, nodes, hashes)
+
+  if snapshot_profiles is None and snapshot_writer is not None:
+    snapshot_writer.add_profile(profile_name, op_table, nodes.entries, f, regex_table)
+
+def stream_optable(profile_name, f, groups):
+  # decode, emit and drop one operation subgraph at a time, only the LRU
+  # caches survive between operations
+  for op_offset, name, clean_name, ops in groups:
+    g = MiniGraph()
+    with stats.phase('nodes'):
+      parse_filternode(g, f, op_offset, regex_table, node_cache)
+    if slice_classes is not None:
+      with stats.phase('slice'):
+        g, [(op_offset, name, clean_name, ops)] = slice_groups(g, [(op_offset, name, clean_name, ops)])
+    if unconditional_only:
+      print_unconditional(profile_name, g, [(op_offset, name, clean_name, ops)])
+      continue
+    if show_summaries:
+      outputdot.node_summaries = summarize_groups(g, [(op_offset, name, clean_name, ops)])
+    with stats.phase('dot'):
+      dump_to_dot(g, op_offset, name, clean_name, profile_name)
+    del g
+
+def peak_memory():
+  """ returns the peak memory in KiB and how it was measured """
+  try:
+    import tracemalloc
+    if tracemalloc.is_tracing():
+      return tracemalloc.get_traced_memory()[1] // 1024, 'tracemalloc'
+  except ImportError:
+    pass
+  import resource
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  if sys.platform == 'darwin':
+    # bytes on OS X, KiB on Linux and the BSDs
+    peak //= 1024
+  return peak, 'maxrss'
+
+def usage():
+  print('usage:')
+  print('    sb2dot [options] sbops.txt sbprofile.bin')
+  print('    sb2dot --daemon SOCKET sbops.txt sbprofile.bin [sbprofile.bin ...]')
+  print()
+  print('    This will turn a binary sandbox profile into a nice .dot graph.')
+  print('    Instead of sbops.txt the Sandbox kext or a decrypted kernelcache can be')
+  print('    given, the extracted operation names are cached by file hash.')
+  print()
+  print('options:')
+  print('    --stats FILE      write phase timings and counters as JSON to FILE (- for stdout,')
+  print('                      progress messages then go to stderr). Phase times exclude the')
+  print('                      phases nested in them, so they can be added up')
+  print('    --format FMT      dot (default), stats-csv, stats-json, sbpl (one .sb file per profile)')
+  print('                      matrix-csv (decision of every profile and operation) or jsonl')
+  print('                      (one JSON record per regex, profile, operation and node)')
+  print('    --output FILE     output file for the stats, matrix and jsonl formats (- for stdout)')
+  print('    --list            list the profiles of a collection and exit')
+  print('    --profile NAME    only decode the named profile (can be repeated)')
+  print('    --op NAME         only decode operations matching NAME or glob (can be repeated)')
+  print('    --manifest FILE   only regenerate graphs that changed since the run that wrote FILE')
+  print('    --snapshot FILE   load decoded profiles from FILE, or write it after decoding')
+  print('    --snapshot-hashes store the --manifest subgraph hashes in new snapshots, so')
+  print('                      --manifest runs that load the snapshot do not compute them')
+  print('    --archive FILE    write all graphs into one .zip, .tar or .tar.gz archive')
+  print('    --compress        deflate the members of a .zip archive')
+  print('    --compact         write smaller .dot files using shared labels and edge defaults')
+  print('    --gzip            gzip every generated .dot file')
+  print('    --partition N     split graphs with more than N nodes into linked files')
+  print('    --slice TYPES     only keep filters of the given types, a comma separated list of')
+  print('                      filter class names or globs and %s' % ', '.join(sorted(slicing.SLICE_GROUPS)))
+  print('    --summaries       add the reachable terminals (allow/deny, modifiers) to every label')
+  print('    --unconditional   only list operations that are always allowed or always denied')
+  print('    --dedup-regex     decompile and render regular expressions accepting the same')
+  print('                      language only once. Comparing costs several times what')
+  print('                      decompiling the used regular expressions does')
+  print('    --sbops-cache DIR where operation names extracted from binaries are cached')
+  print('                      (default ~/.cache/sb2dot)')
+  print('    --daemon SOCKET   keep the profiles decoded and answer JSON queries on a Unix socket')
+  print('    --os NAME         filter table to use: %s (default ios9)' % ', '.join(sorted(filters.filter_tables)))
+  print('    --stream          decode and emit one operation at a time with bounded caches')
+  print('    --cache-size N    number of nodes/strings/regexes kept by --stream (default 4096)')
+  sys.exit(-1)
+
+try:
+  opts, args = getopt.getopt(sys.argv[1:], '', ['stats=', 'format=', 'output=',
+    'stream', 'cache-size=', 'os=', 'list', 'profile=', 'op=', 'manifest=',
+    'snapshot=', 'snapshot-hashes', 'archive=', 'compress',
+    'compact', 'gzip', 'partition=', 'slice=',
+    'summaries', 'unconditional', 'sbops-cache=',
+    'daemon=', 'dedup-regex'])
+except getopt.GetoptError as e:
+  print('[!] ' + str(e))
+  usage()
+
+stats_path = None
+output_format = 'dot'
+output_path = None
+streaming = False
+cache_size = 4096
+list_profiles = False
+selected_profiles = []
+op_patterns = []
+manifest_path = None
+snapshot_path = None
+snapshot_hashes = False
+archive_path = None
+archive_compress = False
+filter_table_name = 'ios9'
+slice_spec = None
+show_summaries = False
+unconditional_only = False
+dedup_regex = False
+sbops_cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'sb2dot')
+daemon_socket = None
+for o, a in opts:
+  if o == '--stats':
+    stats_path = a
+    stats.enable()
+  elif o == '--format':
+    output_format = a
+  elif o == '--output':
+    output_path = a
+  elif o == '--os':
+    if a not in filters.filter_tables:
+      print('[!] unknown filter table: ' + a)
+      usage()
+    filters.set_filter_table(a)
+    filter_table_name = a
+  elif o == '--list':
+    list_profiles = True
+  elif o == '--profile':
+    selected_profiles.append(a)
+  elif o == '--op':
+    op_patterns.append(a)
+  elif o == '--manifest':
+    manifest_path = a
+  elif o == '--snapshot':
+    snapshot_path = a
+  elif o == '--snapshot-hashes':
+    snapshot_hashes = True
+  elif o == '--archive':
+    archive_path = a
+  elif o == '--compress':
+    archive_compress = True
+  elif o == '--compact':
+    outputdot.compact = True
+  elif o == '--gzip':
+    outputdot.gzip_output = True
+  elif o == '--partition':
+    try:
+      outputdot.partition_budget = int(a)
+    except ValueError:
+      outputdot.partition_budget = 0
+    if outputdot.partition_budget < 2:
+      print('[!] --partition needs a node budget of at least 2')
+      usage()
+  elif o == '--daemon':
+    daemon_socket = a
+  elif o == '--sbops-cache':
+    sbops_cache_dir = a
+  elif o == '--summaries':
+    show_summaries = True
+  elif o == '--unconditional':
+    unconditional_only = True
+  elif o == '--dedup-regex':
+    dedup_regex = True
+  elif o == '--slice':
+    slice_spec = a
+  elif o == '--stream':
+    streaming = True
+  elif o == '--cache-size':
+    try:
+      cache_size = int(a)
+    except ValueError:
+      cache_size = 0
+    if cache_size < 1:
+      print('[!] --cache-size needs a positive number')
+      usage()
+
+if len(args) < 2:
+  usage()
+
+if output_format not in ('dot', 'stats-csv', 'stats-json', 'sbpl', 'matrix-csv', 'jsonl'):
+  print('[!] unknown output format: ' + output_format)
+  usage()
+
+if streaming and output_format not in ('dot', 'jsonl'):
+  print('[!] --stream only supports the dot and jsonl output formats')
+  usage()
+
+if output_format == 'jsonl' and (slice_spec is not None or show_summaries):
+  print('[!] --format jsonl writes the unsliced nodes, --slice and --summaries do not apply')
+  usage()
+
+if manifest_path is not None and (output_format != 'dot' or selected_profiles or op_patterns):
+  print('[!] --manifest only works for full runs with the dot output format')
+  usage()
+
+if snapshot_path is not None and streaming:
+  print('[!] --snapshot can not be combined with --stream')
+  usage()
+
+if daemon_socket is not None and (output_format != 'dot' or streaming or manifest_path is not None or
+                                  snapshot_path is not None or archive_path is not None or unconditional_only):
+  print('[!] --daemon can not be combined with output options')
+  usage()
+
+if unconditional_only and (output_format != 'dot' or manifest_path is not None):
+  print('[!] --unconditional can not be combined with --format or --manifest')
+  usage()
+
+if outputdot.partition_budget is not None and manifest_path is not None:
+  print('[!] --partition can not be combined with --manifest')
+  usage()
+
+if archive_path is not None:
+  archive_fmt, compressed = archive.archive_format(archive_path)
+  if archive_fmt is None:
+    print('[!] archive name must end in .zip, .tar, .tar.gz or .tgz')
+    usage()
+  if output_format != 'dot' or manifest_path is not None:
+    print('[!] --archive only works with the dot output format and without --manifest')
+    usage()
+
+if stats_path == '-' and ((output_format == 'jsonl' and output_path == '-') or
+                          list_profiles or unconditional_only):
+  print('[!] --stats - needs stdout for itself, use a file with --output -, --list or --unconditional')
+  usage()
+
+# machine readable output on stdout gets it alone, the progress messages
+# go to stderr
+stdout = sys.stdout
+if stats_path == '-' or (output_format == 'jsonl' and output_path == '-'):
+  sys.stdout = sys.stderr
+
+# resolved after all options, the filter classes depend on --os
+slice_classes = None
+if slice_spec is not None:
+  slice_classes = slicing.resolve_slice(slice_spec)
+  if slice_classes is None:
+    usage()
+
+sbops = load_op_names(args[0])
+sbprofile_path = args[1]
+
+selected_ops = None
+if op_patterns:
+  selected_ops = select_ops(op_patterns)
+
+run_manifest = None
+if manifest_path is not None:
+  key = "%s:%s:%u:%u" % (manifest.file_hash(args[0]), filter_table_name,
+                         outputdot.compact, outputdot.gzip_output)
+  if slice_spec is not None:
+    key += ":" + slice_spec
+  if show_summaries:
+    key += ":summaries"
+  if dedup_regex:
+    key += ":dedup-regex"
+  run_manifest = manifest.Manifest(manifest_path, key, sbprofile_path)
+
+snapshot_profiles = None
+snapshot_writer = None
+if snapshot_path is not None:
+  key = snapshot.snapshot_key(args[0], sbprofile_path, filter_table_name + (dedup_regex and ':dedup-regex' or ''))
+  snapshot_profiles = snapshot.load(snapshot_path, key)
+  if snapshot_profiles is not None:
+    print('[+] using decoded profiles from snapshot ' + snapshot_path)
+  elif list_profiles or selected_profiles or op_patterns or manifest_path is not None:
+    print('[i] not writing a snapshot for a partial run')
+  else:
+    snapshot_writer = snapshot.SnapshotWriter(snapshot_path, key, snapshot_hashes)
+
+if archive_path is not None:
+  print("[+] writing graphs to archive " + archive_path)
+  if archive_fmt == 'zip':
+    compressed = archive_compress
+  outputdot.output_sink = archive.ArchiveWriter(archive_path, archive_fmt, compressed)
+
+node_cache = None
+if streaming:
+  try:
+    import tracemalloc
+    tracemalloc.start()
+  except ImportError:
+    pass
+  node_cache = cache.LRUCache(cache_size, 'node_lru')
+  filters.string_pool = cache.LRUCache(cache_size, 'string_lru')
+  filters.filter_pool = cache.LRUCache(cache_size, 'filter_lru')
+  outputdot.compact_labels = cache.LRUCache(cache_size, 'label_lru')
+
+stats_writer = None
+if output_format.startswith('stats-'):
+  fmt = output_format[len('stats-'):]
+  if output_path is None:
+    output_path = os.path.basename(sbprofile_path) + "_stats." + fmt
+  print("[+] writing graph statistics to " + output_path)
+  stats_writer = graphstats.StatsWriter(compat.open_text(output_path, 'w'), fmt)
+
+matrix_writer = None
+if output_format == 'matrix-csv':
+  if output_path is None:
+    output_path = os.path.basename(sbprofile_path) + "_matrix.csv"
+  print("[+] writing the decision matrix to " + output_path)
+  matrix_writer = matrix.MatrixWriter(compat.open_text(output_path, 'w'))
+
+jsonl_writer = None
+if output_format == 'jsonl':
+  if output_path is None:
+    output_path = os.path.basename(sbprofile_path) + ".jsonl"
+  if output_path == '-':
+    jsonl_writer = jsonl.JsonlWriter(stdout)
+  else:
+    print("[+] writing JSON records to " + output_path)
+    jsonl_writer = jsonl.JsonlWriter(compat.open_text(output_path, 'w'))
+
+def decode_file(f, sbprofile_path):
+  """ decodes one profile file, f is a file object or macho.MemoryFile """
+  global regex_table
+  global subgraph_hasher
+
+  f = stats.wrap_file(f)
+  filters.reset_pools()
+  outputdot.compact_labels.clear()
+  if matrix_writer is not None:
+    matrix_writer.source = os.path.basename(sbprofile_path)
+  if jsonl_writer is not None:
+    jsonl_writer.source = os.path.basename(sbprofile_path)
+    
+  # read in short header
+  flags, re_table_offset, re_table_count = struct.unpack('<HHH', f.read(6))
+
+  # read in the regex table
+  f.seek(re_table_offset * 8)
+  re_table = struct.unpack('<%dH' % re_table_count, f.read(2 * re_table_count))
+
+  if dedup_regex:
+    dedup_regexes(f, re_table)
+
+  if streaming:
+    regex_table = LazyRegexTable(f, re_table, cache.LRUCache(cache_size, 'regex_lru'))
+  elif (stats_writer is not None or matrix_writer is not None or unconditional_only) and \
+       snapshot_writer is None and jsonl_writer is None:
+    # these outputs never show regex text, a snapshot would keep it
+    regex_table = LazyRegexTable(f, re_table, cache.Pool(), decompile=False)
+  elif list_profiles or selected_profiles or selected_ops is not None or run_manifest is not None or \
+       snapshot_profiles is not None or dedup_regex:
+    regex_table = LazyRegexTable(f, re_table, cache.Pool())
+  else:
+    print("[+] loading and decoding regular expressions")
+    regex_table = LazyRegexTable(f, re_table, cache.Pool())
+    for idx in range(len(re_table)):
+      regex_table.entry(idx)
+
+  if run_manifest is not None:
+    subgraph_hasher = manifest.SubgraphHasher(f, re_table)
+
+  # now read the profile(s)
+  if flags == 0x8000:
+    # this is a profile collection
+    print('[+] found: profile collection')
+
+    index = read_profile_index(f)
+    print('[i] collection count %u' % len(index))
+
+    if list_profiles:
+      for profile_name, op_table in index:
+        print(profile_name)
+      index = []
+    elif selected_profiles:
+      by_name = dict(index)
+      index = []
+      for profile_name in selected_profiles:
+        if profile_name in by_name:
+          index.append((profile_name, by_name[profile_name]))
+        else:
+          print('[!] profile not found: ' + profile_name)
+
+    for profile_name, op_table in index:
+      print("[+] decoding profile: " + profile_name)
+      decode_profile(profile_name, f, op_table)
+      
+  elif list_profiles:
+    print('[+] found: single profile')
+    print(sbprofile_path)
+
+  else: # flags are usually 0 (sometimes 1,2)
+    # this is a single profile
+    print('[+] found: single profile')
+    if selected_profiles:
+      print('[!] --profile is ignored for single profiles')
+    print('[+] decoding profile')
+
+    f.seek(3*2)
+    op_table = struct.unpack('<%dH' % OP_TABLE_COUNT, f.read(2 * OP_TABLE_COUNT))
+    profile_name = sbprofile_path
+    decode_profile(profile_name, f, op_table)
+
+  if dedup_regex:
+    report_dedup()
+
+def decode_graphs(f, sbprofile_path):
+  """ decodes all profiles of a profile file completely, for --daemon.
+      Returns [(profile name, graph, op table)]. """
+  global regex_table
+
+  filters.reset_pools()
+  flags, re_table_offset, re_table_count = struct.unpack('<HHH', f.read(6))
+  f.seek(re_table_offset * 8)
+  re_table = struct.unpack('<%dH' % re_table_count, f.read(2 * re_table_count))
+  regex_table = LazyRegexTable(f, re_table, cache.Pool())
+
+  if flags == 0x8000:
+    index = read_profile_index(f)
+  else:
+    f.seek(3*2)
+    index = [(sbprofile_path, struct.unpack('<%dH' % OP_TABLE_COUNT, f.read(2 * OP_TABLE_COUNT)))]
+
+  graphs = []
+  for profile_name, op_table in index:
+    g = MiniGraph()
+    for op_offset in sorted(set(op_table)):
+      parse_filternode(g, f, op_offset, regex_table)
+    graphs.append((profile_name, g, op_table))
+  return graphs
+
+def load_graphs(path):
+  if macho.is_macho(path):
+    graphs = []
+    for name, data in macho.builtin_profiles(path):
+      graphs.extend(decode_graphs(macho.MemoryFile(data), name + '.bin'))
+    return graphs
+  with open(path, 'rb') as f:
+    return decode_graphs(f, path)
+
+if daemon_socket is not None:
+  daemon.serve(daemon_socket, daemon.ProfileStore(args[1:], load_graphs, sbops))
+  sys.exit(0)
+
+if macho.is_macho(sbprofile_path):
+  print('[+] found: Mach-O binary')
+  try:
+    builtin = macho.builtin_profiles(sbprofile_path)
+  except (macho.MachOError, struct.error) as e:
+    print('[!] cannot extract built-in profiles: ' + str(e))
+    sys.exit(-1)
+  print('[i] found %u built-in profiles' % len(builtin))
+  for name, data in builtin:
+    # named like the files written by extract_sbprofiles
+    print('[+] built-in profile: ' + name)
+    decode_file(macho.MemoryFile(data), name + '.bin')
+else:
+  with open(sbprofile_path, 'rb') as f:
+    decode_file(f, sbprofile_path)
+
+if snapshot_writer is not None:
+  print('[+] writing snapshot ' + snapshot_path)
+  snapshot_writer.write()
+
+if stats_writer is not None:
+  stats_writer.close()
+
+if matrix_writer is not None:
+  matrix_writer.close()
+
+if jsonl_writer is not None:
+  jsonl_writer.close()
+
+if outputdot.output_sink is not None:
+  with stats.phase('archive'):
+    outputdot.output_sink.close()
+
+if run_manifest is not None:
+  run_manifest.finish()
+  run_manifest.report()
+
+if streaming:
+  peak, source = peak_memory()
+  print("[i] peak memory: %u KiB (%s)" % (peak, source))
+  if stats.enabled:
+    stats.count('peak_memory_kb', peak)
+
+if stats_path is not None:
+  stats.write_report(stats_path, stdout)
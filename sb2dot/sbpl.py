@@ -0,0 +1,222 @@
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: sbpl.py
+# task: decompiles decision graphs back to SBPL rules (--format sbpl)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Every (node, terminal) pair is turned into the condition under which the
+# node ends in that terminal, each pair is visited once. Conditions of
+# nodes with more than one parent are written once as a define and then
+# referenced by name, so the output grows linearly with the graph instead
+# of with the number of paths.
+#
+
+import os
+
+WIDTH = 78
+
+def terminal_slug(t):
+  if t.allow:
+    slug = 'allow'
+  else:
+    slug = 'deny'
+  return '-'.join([slug] + t.modifiers)
+
+def terminal_rule(t):
+  if t.allow:
+    rule = 'allow'
+  else:
+    rule = 'deny'
+  return rule + ''.join([' (with %s)' % m for m in t.modifiers])
+
+# conditions are True, False, a string (filter or define name) or a tuple
+# (operator, operand, ...), nested operators are flattened on output
+
+def conj(a, b):
+  if a is False or b is False:
+    return False
+  if a is True:
+    return b
+  if b is True:
+    return a
+  return ('require-all', a, b)
+
+def disj(a, b):
+  if a is True or b is True:
+    return True
+  if a is False:
+    return b
+  if b is False:
+    return a
+  return ('require-any', a, b)
+
+def negate(a):
+  if isinstance(a, tuple) and a[0] == 'require-not':
+    return a[1]
+  return ('require-not', a)
+
+def operands(e):
+  op = e[0]
+  stack = list(reversed(e[1:]))
+  while stack:
+    x = stack.pop()
+    if isinstance(x, tuple) and x[0] == op and op != 'require-not':
+      stack.extend(reversed(x[1:]))
+    else:
+      yield x
+
+def flat(e, limit):
+  """ e on one line, or None if that is longer than limit """
+  parts = []
+  stack = [e]
+  size = 0
+  while stack:
+    x = stack.pop()
+    if isinstance(x, tuple):
+      stack.append(')')
+      args = list(operands(x))
+      args.reverse()
+      for a in args:
+        stack.append(a)
+        stack.append(' ')
+      x = '(' + x[0]
+    size += len(x)
+    if size > limit:
+      return None
+    parts.append(x)
+  return ''.join(parts)
+
+def render(e, indent, out):
+  s = flat(e, WIDTH - indent)
+  if s is not None:
+    out.append(s)
+    return
+  if not isinstance(e, tuple):
+    out.append(e)
+    return
+  out.append('(' + e[0])
+  for x in operands(e):
+    out.append('\n' + ' ' * (indent + 2))
+    render(x, indent + 2, out)
+  out.append(')')
+
+class Decompiler(object):
+  """ summaries are the reachable terminals of every node (summary.py) """
+  def __init__(self, g, summaries):
+    self.g = g
+    self.summaries = summaries
+    self.memo = {}
+    self.atoms = {}
+    self.defines = []
+
+  def atom(self, tag):
+    a = self.atoms.get(tag)
+    if a is None:
+      a = self.atoms[tag] = str(tag).replace("\0", "")
+    return a
+
+  def node_condition(self, u, t):
+    g = self.g
+    branches = g.getBranches(u)
+    if branches is None:
+      # merge node of a sliced graph (slicing.py), either way is possible
+      e = False
+      for v in g.edges[u]:
+        e = disj(e, self.memo[(v, t)])
+      return e
+    match, unmatch = branches
+    a = self.atom(g.getTag(u))
+    return disj(conj(a, self.memo[(match, t)]),
+                conj(negate(a), self.memo[(unmatch, t)]))
+
+  def condition(self, root, t):
+    """ condition under which root ends in terminal t """
+    memo = self.memo
+    summaries = self.summaries
+    stack = [root]
+    while stack:
+      u = stack[-1]
+      key = (u, t)
+      if key in memo:
+        stack.pop()
+        continue
+      terms = summaries[u]
+      if t not in terms:
+        memo[key] = False
+        stack.pop()
+        continue
+      if len(terms) == 1:
+        memo[key] = True
+        stack.pop()
+        continue
+      pending = [v for v in self.g.edges[u] if (v, t) not in memo]
+      if pending:
+        stack.extend(pending)
+        continue
+      stack.pop()
+
+      e = self.node_condition(u, t)
+      if isinstance(e, tuple) and e[0] != 'require-not' and len(self.g.redges[u]) > 1:
+        name = '%s-n%u' % (terminal_slug(t), u)
+        self.defines.append((name, e))
+        e = name
+      memo[key] = e
+    return memo[(root, t)]
+
+def rule_text(t, op_names, e):
+  head = '(%s %s' % (terminal_rule(t), ' '.join(op_names))
+  if e is True:
+    return head + ')'
+  s = flat(e, WIDTH - len(head) - 2)
+  if s is not None:
+    return head + ' ' + s + ')'
+  out = [head, '\n  ']
+  render(e, 2, out)
+  out.append(')')
+  return ''.join(out)
+
+def decompile(profile_name, g, summaries, rules):
+  """ rules is a list of (root node, operation names), returns the text
+      of an SBPL profile """
+  d = Decompiler(g, summaries)
+  texts = []
+  for root, op_names in rules:
+    for t in sorted(summaries[root], key=repr):
+      texts.append(rule_text(t, op_names, d.condition(root, t)))
+
+  out = [';; decompiled from %s by sb2dot\n' % os.path.basename(profile_name),
+         '(version 1)\n']
+  if d.defines:
+    out.append('\n')
+  for name, e in d.defines:
+    head = '(define %s' % name
+    s = flat(e, WIDTH - len(head) - 2)
+    if s is not None:
+      out.append('%s %s)\n' % (head, s))
+    else:
+      parts = [head, '\n  ']
+      render(e, 2, parts)
+      out.append(''.join(parts) + ')\n')
+  out.append('\n')
+  for text in texts:
+    out.append(text + '\n')
+  return ''.join(out)
+
+def sbpl_filename(profile_name):
+  return os.path.basename(profile_name) + ".sb"
@@ -0,0 +1,140 @@
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: slicing.py
+# task: projects decision graphs onto selected filter types (--slice)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+from __future__ import print_function
+import fnmatch
+import filters
+from minigraph import MiniGraph
+
+class DontCare(object):
+  """ tag of a node that stands for a filter outside the slice, both
+      successors stay reachable because either one may be taken """
+  __slots__ = ()
+
+  def __repr__(self):
+    return '(any)'
+
+DONT_CARE = DontCare()
+
+# names usable in a slice specification next to filter class names
+SLICE_GROUPS = {
+  'path': (filters.LiteralFilter, filters.RegexFilter,
+           filters.MountRelativeFilter, filters.MountRelativeRegexFilter),
+  'entitlement': (filters.RequireEntitlementFilter,
+                  filters.EntitlementBooleanCompareFilter,
+                  filters.EntitlementStringCompareFilter),
+  'network': (filters.LocalFilter, filters.RemoteFilter,
+              filters.SocketDomainFilter, filters.SocketTypeFilter,
+              filters.SocketProtocolFilter),
+  'iokit': (filters.IOKitFilter, filters.IOKitRegexFilter,
+            filters.IOKitPropertyFilter, filters.IOKitPropertyRegexFilter,
+            filters.IOKitConnectionFilter),
+  'mach': (filters.GlobalNameFilter, filters.GlobalNameRegexFilter,
+           filters.LocalNameFilter, filters.LocalNameRegexFilter),
+}
+
+def filter_classes():
+  """ names of all filter classes of the current filter table """
+  classes = {'GenericFilter': filters.GenericFilter}
+  for cls, decode_arg in filters.filter_table.values():
+    classes[cls.__name__] = cls
+  return classes
+
+def resolve_slice(spec):
+  """ turns a comma separated list of group names, filter class names or
+      class name globs into a tuple of classes, returns None for names
+      that match nothing """
+  known = filter_classes()
+  selected = []
+  for name in spec.split(','):
+    name = name.strip()
+    if name in SLICE_GROUPS:
+      matched = list(SLICE_GROUPS[name])
+    else:
+      matched = [known[n] for n in sorted(known) if fnmatch.fnmatchcase(n, name)]
+    if len(matched) == 0:
+      print('[!] no filter type matches: ' + name)
+      return None
+    for cls in matched:
+      if cls not in selected:
+        selected.append(cls)
+  return tuple(selected)
+
+def slice_graph(g, roots, classes):
+  """ projects the graphs below roots onto the filters of the given classes
+
+      Nodes of other filters become DONT_CARE merges of their sliced
+      successors. A node whose successors slice to the same node is
+      replaced by it, equal terminals and equal merges are shared. Every
+      node is visited once, the memo is shared by all roots.
+
+      Returns the sliced graph and a dict mapping each root to its sliced
+      root. Sliced nodes keep the id of the first original node they were
+      built from.
+  """
+  sg = MiniGraph()
+  sliced = {}
+  unique = {}
+
+  for root in roots:
+    stack = [root]
+    while stack:
+      u = stack[-1]
+      if u in sliced:
+        stack.pop()
+        continue
+      pending = [v for v in g.edges[u] if v not in sliced]
+      if pending:
+        stack.extend(pending)
+        continue
+      stack.pop()
+
+      tag = g.getTag(u)
+      children = set([sliced[v] for v in g.edges[u]])
+      if len(children) == 0:
+        key = ('T', tag)
+      elif len(children) == 1:
+        # the filter can not change the outcome
+        sliced[u] = children.pop()
+        continue
+      elif isinstance(tag, classes):
+        key = None
+      else:
+        tag = DONT_CARE
+        key = ('*', frozenset(children))
+
+      if key is not None and key in unique:
+        sliced[u] = unique[key]
+        continue
+      sg.setTag(u, tag)
+      sg.addNode(u)
+      for v in children:
+        sg.addEdge(u, v)
+      if key is None:
+        match, unmatch = g.getBranches(u)
+        sg.setBranches(u, sliced[match], sliced[unmatch])
+      if key is not None:
+        unique[key] = u
+      sliced[u] = u
+
+  return sg, dict([(root, sliced[root]) for root in roots])
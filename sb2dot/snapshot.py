@@ -0,0 +1,294 @@
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: snapshot.py
+# task: snapshots of decoded profiles for instant reload (--snapshot)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# file layout (little endian):
+#
+#   header    '8sII20s'  magic, version, flags, key (sha1 of sbops file,
+#                        profile file and filter table)
+#   counts    'II'       number of pool strings, number of profiles
+#   pool      per string 'I' length + bytes, NO_VALUE as length stands
+#             for a missing string
+#   profiles  'III'      name (pool index), op count, node count
+#             op table   'H' * op count
+#             nodes      flat arrays of node count entries each:
+#                        offset 'H', terminal 'B', filter 'B', filter_arg 'H',
+#                        value 'I', match 'H', unmatch 'H'
+#             hashes     20 bytes per node if FLAG_HASHES is set, the
+#                        manifest.SubgraphHasher digest of the node
+#
+# value is the terminal result, the pool index of a string argument, the
+# pool index of a regex followed by its bytecode (the regex is missing if
+# it failed to decompile) or a packed network argument.
+#
+
+from __future__ import print_function
+import array
+import hashlib
+import os
+import struct
+import sys
+import cache
+import compat
+import filters
+import manifest
+from filters import *
+
+SNAPSHOT_MAGIC = b'SB2DSNAP'
+SNAPSHOT_VERSION = 4
+
+FLAG_HASHES = 1
+
+NO_VALUE = 0xffffffff
+
+HEADER = struct.Struct('<8sII20s')
+COUNTS = struct.Struct('<II')
+PROFILE = struct.Struct('<III')
+
+NODE_ARRAYS = ('H', 'B', 'B', 'H', 'I', 'H', 'H')
+
+def snapshot_key(sbops_path, profile_path, filter_table_name):
+  h = hashlib.sha1()
+  for fn in (sbops_path, profile_path):
+    f = open(fn, 'rb')
+    h.update(hashlib.sha1(f.read()).digest())
+    f.close()
+  h.update(compat.binary(filter_table_name))
+  return h.digest()
+
+def array_to_bytes(a):
+  if sys.byteorder != 'little':
+    a = array.array(a.typecode, a)
+    a.byteswap()
+  if compat.PY3:
+    return a.tobytes()
+  return a.tostring()
+
+def array_from_bytes(typecode, data):
+  a = array.array(typecode)
+  if compat.PY3:
+    a.frombytes(data)
+  else:
+    a.fromstring(data)
+  if sys.byteorder != 'little':
+    a.byteswap()
+  return a
+
+class SnapshotWriter(object):
+  def __init__(self, path, key, with_hashes=False):
+    self.path = path
+    self.key = key
+    self.with_hashes = with_hashes
+    self.pool = []
+    self.pool_index = {}
+    self.profiles = []
+
+  def intern(self, s):
+    idx = self.pool_index.get(s)
+    if idx is None:
+      idx = self.pool_index[s] = len(self.pool)
+      self.pool.append(s)
+    return idx
+
+  def intern_regex(self, s, raw):
+    """ the regex and its bytecode take two pool slots in a row """
+    key = ('regex', s, raw)
+    idx = self.pool_index.get(key)
+    if idx is None:
+      idx = self.pool_index[key] = len(self.pool)
+      self.pool.append(s)
+      self.pool.append(raw)
+    return idx
+
+  def value(self, f, re_table, filter, filter_arg):
+    entry = filters.filter_table.get(filter)
+    if entry is None:
+      return 0
+    decode_arg = entry[1]
+    if decode_arg is arg_regex:
+      return self.intern_regex(*decode_arg(f, re_table, filter_arg))
+    elif decode_arg in (arg_string, arg_string_nopadding):
+      s = decode_arg(f, re_table, filter_arg)[0]
+      if s is None:
+        return NO_VALUE
+      return self.intern(s)
+    elif decode_arg is arg_network:
+      typ, addr, port = get_network(f, filter_arg)
+      return (typ << 24) | (addr << 16) | port
+    return 0
+
+  def add_profile(self, name, op_table, nodes, f, re_table):
+    """ nodes maps offsets to the tuples returned by read_filternode,
+        re_table is the LazyRegexTable of the profile file """
+    arrays = [array.array(typecode) for typecode in NODE_ARRAYS]
+    offsets, terminals, filter_ids, args, values, matches, unmatches = arrays
+    for offset in sorted(nodes):
+      tag, match, unmatch, filter, filter_arg = nodes[offset]
+      offsets.append(offset)
+      args.append(filter_arg)
+      if match is None:
+        terminals.append(1)
+        filter_ids.append(0)
+        values.append(filter_arg)
+        matches.append(0)
+        unmatches.append(0)
+      else:
+        terminals.append(0)
+        filter_ids.append(filter)
+        values.append(self.value(f, re_table, filter, filter_arg))
+        matches.append(match)
+        unmatches.append(unmatch)
+
+    hashes = None
+    if self.with_hashes:
+      # --manifest runs that load the snapshot use them instead of
+      # hashing the subgraphs in the profile file again
+      hasher = manifest.SubgraphHasher(f, re_table.offsets)
+      hashes = b"".join([hasher.node(offset) for offset in offsets])
+    self.profiles.append((self.intern(name), op_table, arrays, hashes))
+
+  def write(self):
+    out = [HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                       self.with_hashes and FLAG_HASHES or 0, self.key),
+           COUNTS.pack(len(self.pool), len(self.profiles))]
+    for s in self.pool:
+      if s is None:
+        out.append(struct.pack('<I', NO_VALUE))
+        continue
+      if not isinstance(s, bytes):
+        s = compat.binary(s)
+      out.append(struct.pack('<I', len(s)))
+      out.append(s)
+    for name_idx, op_table, arrays, hashes in self.profiles:
+      out.append(PROFILE.pack(name_idx, len(op_table), len(arrays[0])))
+      out.append(array_to_bytes(array.array('H', op_table)))
+      for a in arrays:
+        out.append(array_to_bytes(a))
+      if hashes is not None:
+        out.append(hashes)
+
+    # write to a temporary name first, a half written snapshot must never
+    # be picked up by the next run
+    f = open(self.path + '.tmp', 'wb')
+    f.write(b"".join(out))
+    f.close()
+    os.rename(self.path + '.tmp', self.path)
+
+class SnapshotProfile(object):
+  def __init__(self, name, op_table, nodes, hashes):
+    self.name = name
+    self.op_table = op_table
+    self.nodes = nodes
+    self.hashes = hashes
+
+def make_tag(pool, raw_pool, terminal, filter, filter_arg, value):
+  if terminal:
+    return get_terminal(value)
+  entry = filters.filter_table.get(filter)
+  if entry is None:
+    return GenericFilter(filter, filter_arg)
+  cls, decode_arg = entry
+  if decode_arg is arg_regex:
+    return cls(pool[value], raw_pool[value + 1])
+  elif decode_arg in (arg_string, arg_string_nopadding):
+    if value == NO_VALUE:
+      return cls(None)
+    return cls(pool[value])
+  elif decode_arg is arg_network:
+    return cls((value >> 24, (value >> 16) & 0xff, value & 0xffff))
+  return cls(*decode_arg(None, None, filter_arg))
+
+def load(path, key):
+  """ returns a dict of SnapshotProfile by name, or None if the snapshot
+      is missing, damaged or was written for other input files """
+  if not os.path.exists(path):
+    return None
+  f = open(path, 'rb')
+  data = f.read()
+  f.close()
+
+  try:
+    magic, version, flags, file_key = HEADER.unpack_from(data, 0)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+      print('[i] snapshot %s has an unsupported format, ignoring it' % path)
+      return None
+    if file_key != key:
+      print('[i] snapshot %s is stale, ignoring it' % path)
+      return None
+
+    pos = HEADER.size
+    pool_count, profile_count = COUNTS.unpack_from(data, pos)
+    pos += COUNTS.size
+
+    # text for names and arguments, bytes for the regex bytecode
+    pool = []
+    raw_pool = []
+    for i in range(pool_count):
+      size, = struct.unpack_from('<I', data, pos)
+      pos += 4
+      if size == NO_VALUE:
+        pool.append(None)
+        raw_pool.append(None)
+        continue
+      raw = data[pos:pos+size]
+      pool.append(intern(compat.text(raw)))
+      raw_pool.append(raw)
+      pos += size
+
+    profiles = {}
+    tags = {}
+    for i in range(profile_count):
+      name_idx, op_count, node_count = PROFILE.unpack_from(data, pos)
+      pos += PROFILE.size
+      op_table = tuple(array_from_bytes('H', data[pos:pos + 2*op_count]))
+      pos += 2*op_count
+      arrays = []
+      for typecode in NODE_ARRAYS:
+        size = array.array(typecode).itemsize * node_count
+        arrays.append(array_from_bytes(typecode, data[pos:pos+size]))
+        pos += size
+      hashes = None
+      if flags & FLAG_HASHES:
+        hashes = {}
+        for n, offset in enumerate(arrays[0]):
+          hashes[offset] = data[pos + 20*n:pos + 20*(n+1)]
+        pos += 20*node_count
+
+      nodes = cache.Pool()
+      for offset, terminal, filter, filter_arg, value, match, unmatch in zip(*arrays):
+        # share tags between nodes like filters.get_filter() does
+        tag_key = (terminal, filter, filter_arg, value)
+        tag = tags.get(tag_key)
+        if tag is None:
+          tag = tags[tag_key] = make_tag(pool, raw_pool, terminal, filter, filter_arg, value)
+        if terminal:
+          nodes.put(offset, (tag, None, None, None, filter_arg))
+        else:
+          nodes.put(offset, (tag, match, unmatch, filter, filter_arg))
+      name = pool[name_idx]
+      profiles[name] = SnapshotProfile(name, op_table, nodes, hashes)
+    if pos != len(data):
+      raise ValueError('trailing data')
+  except (struct.error, ValueError, IndexError):
+    print('[!] snapshot %s is truncated, ignoring it' % path)
+    return None
+
+  return profiles
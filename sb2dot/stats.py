@@ -0,0 +1,135 @@
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: stats.py
+# task: optional phase timing and hot-path counters (--stats)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+from __future__ import print_function
+import json
+import time
+
+# callers test this flag before touching any counter, so a run without
+# --stats only pays for one global lookup per instrumented spot
+enabled = False
+
+counters = {}
+phases = {}
+
+# phases can nest ('regex' runs inside 'filters' inside 'nodes'), only the
+# innermost running phase is charged. The phase times are self times, they
+# do not overlap and add up to the time spent in all phases.
+running = []
+
+if hasattr(time, 'process_time'):
+  cpu_clock = time.process_time
+else:
+  cpu_clock = time.clock
+
+def enable():
+  global enabled
+  enabled = True
+  counters.clear()
+  phases.clear()
+  del running[:]
+
+def count(name, n=1):
+  counters[name] = counters.get(name, 0) + n
+
+class Phase(object):
+  def __init__(self, name):
+    self.name = name
+
+  def start(self):
+    self.wall = time.time()
+    self.cpu = cpu_clock()
+
+  def charge(self):
+    """ adds the time since start() to the phase """
+    p = phases.get(self.name)
+    if p is None:
+      p = phases[self.name] = {'wall': 0.0, 'cpu': 0.0, 'calls': 0}
+    p['wall'] += time.time() - self.wall
+    p['cpu'] += cpu_clock() - self.cpu
+    return p
+
+  def __enter__(self):
+    if running:
+      running[-1].charge()
+    running.append(self)
+    self.start()
+    return self
+
+  def __exit__(self, typ, value, tb):
+    self.charge()['calls'] += 1
+    running.pop()
+    if running:
+      running[-1].start()
+    return False
+
+class NullPhase(object):
+  def __enter__(self):
+    return self
+
+  def __exit__(self, typ, value, tb):
+    return False
+
+null_phase = NullPhase()
+
+def phase(name):
+  if enabled:
+    return Phase(name)
+  return null_phase
+
+class CountingFile(object):
+  """ wraps a profile file and counts seeks and bytes read """
+  def __init__(self, f):
+    self.f = f
+
+  def seek(self, offset, whence=0):
+    counters['seeks'] = counters.get('seeks', 0) + 1
+    return self.f.seek(offset, whence)
+
+  def read(self, size=-1):
+    data = self.f.read(size)
+    counters['reads'] = counters.get('reads', 0) + 1
+    counters['bytes_read'] = counters.get('bytes_read', 0) + len(data)
+    return data
+
+  def tell(self):
+    return self.f.tell()
+
+def wrap_file(f):
+  if enabled:
+    return CountingFile(f)
+  return f
+
+def report():
+  return {'phases': phases, 'counters': counters}
+
+def write_report(fn, stdout):
+  """ fn '-' writes to stdout """
+  if fn == '-':
+    stdout.write(json.dumps(report(), indent=2, sort_keys=True, separators=(', ', ': ')) + "\n")
+    stdout.flush()
+    return
+  f = open(fn, 'w')
+  json.dump(report(), f, indent=2, sort_keys=True, separators=(', ', ': '))
+  f.write("\n")
+  f.close()
@@ -0,0 +1,114 @@
+#
+# sb2dot - a sandbox binary profile to dot convertor for iOS 9 and OS X 10.11
+# Copyright (C) 2015 Stefan Esser / SektionEins GmbH <stefan@sektioneins.de>
+#    uses and extends code from Dionysus Blazakis with his permission
+#
+# module: summary.py
+# task: reachable terminal summaries of decision graph nodes
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import stats
+
+def reachable_terminals(g, roots, summaries=None):
+  """ maps every node below roots to the frozenset of terminal tags it can
+      reach, in one bottom-up pass. Equal sets are shared, so comparing
+      summaries by identity is enough. Pass the result of an earlier call
+      as summaries to extend it to more roots. """
+  if summaries is None:
+    summaries = {}
+  unique = {}
+  for s in summaries.values():
+    unique.setdefault(s, s)
+
+  for root in roots:
+    stack = [root]
+    while stack:
+      u = stack[-1]
+      if u in summaries:
+        stack.pop()
+        continue
+      pending = [v for v in g.edges[u] if v not in summaries]
+      if pending:
+        stack.extend(pending)
+        continue
+      stack.pop()
+
+      children = [summaries[v] for v in g.edges[u]]
+      if len(children) == 0:
+        s = frozenset([g.getTag(u)])
+      elif len(children) == 1 or children[0] is children[1]:
+        s = children[0]
+      else:
+        s = children[0] | children[1]
+      summaries[u] = unique.setdefault(s, s)
+
+  if stats.enabled:
+    stats.count('summary_nodes', len(summaries))
+    stats.count('summary_sets', len(unique))
+  return summaries
+
+def verdict(terms):
+  """ 'allow', 'deny' or 'mixed' """
+  allow = [t.allow for t in terms]
+  if all(allow):
+    return 'allow'
+  elif not any(allow):
+    return 'deny'
+  return 'mixed'
+
+def modifiers(terms):
+  found = set()
+  for t in terms:
+    found.update(t.modifiers)
+  return sorted(found)
+
+def summary_label(terms):
+  v = verdict(terms)
+  if v == 'mixed':
+    label = 'allow or deny'
+  else:
+    label = v + ' only'
+  mods = modifiers(terms)
+  if mods:
+    label += ' (%s)' % ' '.join(mods)
+  return label
+
+def is_unconditional(terms):
+  """ true if the node always ends in the same terminal """
+  return len(terms) == 1
+
+def evaluate(g, u, test, summaries):
+  """ follows the decision graph from u and returns the terminal reached.
+      test(tag) decides whether a filter matches. The walk stops as soon as
+      only one terminal is reachable, without testing the filters below.
+      Returns None at the merge nodes of a sliced graph (slicing.py). """
+  while True:
+    terms = summaries[u]
+    if len(terms) == 1:
+      if stats.enabled and g.edges[u]:
+        stats.count('evaluate_short_circuits')
+      for t in terms:
+        return t
+    branches = g.getBranches(u)
+    if branches is None:
+      return None
+    match, unmatch = branches
+    tag = g.getTag(u)
+    if test(tag):
+      u = match
+    else:
+      u = unmatch